@@ -0,0 +1,118 @@
+import itertools
+import math
+
+import pandas as pd
+
+from attack_engine import distinct_candidates
+from matchkey_spec import DERIVED_FIELDS
+from matchkeys import MatchKeyPlan, apply_transform, normalize_values
+
+# Full plaintext domains and per-key domain size (entropy) estimates.
+# Some components have small, fully known domains: initials, years of birth, calendar dates, their
+# year-month prefixes and Soundex codes. Keys built only from such components (mk9: 26 x 26 x 120) or
+# with one extra small reference column can be enumerated exhaustively and then fully inverted,
+# instead of sampling the top-K values of each field. Domains are given in the prepared-candidates
+# format of MatchKeyPlan.prepare_candidates, so every attack mode can run on them unchanged.
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+DEFAULT_YEARS = (1905, 2024)  # 120 years of birth
+
+# Every code soundex_simple gives a name starting with a letter: the upper-case letter and up to
+# three digits 1-6 with no digit repeated back to back, padded with zeros
+def soundex_codes():
+    codes = []
+    for letter in LETTERS.upper():
+        for n in range(4):
+            for digits in itertools.product("123456", repeat=n):
+                if all(a != b for a, b in zip(digits, digits[1:])):
+                    codes.append((letter + "".join(digits) + "000")[:4])
+    return codes
+
+# Every calendar date of the given years, as YYYY-MM-DD
+def calendar_dates(first_year, last_year):
+    return pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq="D").strftime("%Y-%m-%d").tolist()
+
+# Transformed values (what the component hashes) of a component with a synthetic domain, else None.
+# derived is the (source column, format) a scheme builds the field from (DERIVED_FIELDS), if any:
+# the ONS dob only takes the YYYY-01-01 date of each year.
+def _synthetic_domain(field, transform, years, derived=None):
+    first_year, last_year = years
+    if derived is not None:
+        source, template = derived
+        if source != "year_of_birth":
+            return None
+        values = [template.format(year) for year in range(first_year, last_year + 1)]
+        return list(dict.fromkeys(apply_transform(transform, values)))
+    if transform == "initial":
+        return list(LETTERS)
+    if transform == "soundex":
+        return soundex_codes()
+    if field == "dob" and transform is None:
+        return calendar_dates(first_year, last_year)
+    if field == "dob" and transform == "year_month":
+        return [f"{year}-{month:02d}" for year in range(first_year, last_year + 1) for month in range(1, 13)]
+    if field == "year_of_birth" and transform is None:
+        return [str(year) for year in range(first_year, last_year + 1)]
+    return None
+
+# Full domain of every (source, transform) node of a plan: synthetic where it is known (see above;
+# fields the plan's scheme derives from the year of birth take one value per year), else every
+# distinct value of the source column of the reference DataFrame (most frequent first).
+def domain_candidates(plan, reference, years=DEFAULT_YEARS):
+    derived = DERIVED_FIELDS.get(plan.scheme, {})
+    domains = {}
+    for key in plan.keys:
+        for component in key.components:
+            source = component.source or component.field
+            node = (source, component.transform)
+            if node in domains:
+                continue
+            values = _synthetic_domain(component.field, component.transform, years, derived.get(component.field))
+            if values is not None:
+                domains[node] = list(zip(values, normalize_values(values)))
+            elif source in reference.columns:
+                values = reference[source].value_counts().index.tolist()
+                domains[node] = list(zip(values, normalize_values(apply_transform(component.transform, values))))
+            else:
+                domains[node] = []
+    return domains
+
+# Number of distinct pre-images every key can form from the domains
+def key_domain_sizes(plan, domains):
+    return {key.name: math.prod(len(candidates) for candidates in distinct_candidates(plan.candidate_lists(key.name, domains)))
+            for key in plan.keys}
+
+# Entropy of every key in bits, assuming uniform pre-images (an upper bound): log2 of its domain size
+def key_entropy_bits(sizes):
+    return {name: math.log2(size) if size else 0.0 for name, size in sizes.items()}
+
+# Split a plan by strategy: keys whose domain has at most threshold pre-images are enumerated
+# exhaustively, the others are left to top-K or best-first sampling. Returns (exhaustive, sampled).
+def split_plan(plan, sizes, threshold):
+    exhaustive = [key for key in plan.keys if 0 < sizes[key.name] <= threshold]
+    sampled = [key for key in plan.keys if key not in exhaustive]
+    return MatchKeyPlan(exhaustive, plan.scheme), MatchKeyPlan(sampled, plan.scheme)
+
+# Soundex code space of a reference column: {normalized code: names with that code}, codes and
+# names most frequent first. Names without a code (empty after normalization) are left out.
+def soundex_code_index(reference, source):
+    names = reference[source].value_counts().index.tolist()
+    index = {}
+    for name, code in zip(names, normalize_values(apply_transform("soundex", names))):
+        if code:
+            index.setdefault(code, []).append(name)
+    return index
+
+# Phonetic components over every Soundex code observed in the reference data instead of the codes
+# of the top-K names: a copy of prepared whose Soundex nodes hold one candidate per observed code
+# (its most frequent name), plus the reverse indexes {(source, "soundex"): {code: names}} for
+# reporting every name behind a hit.
+def phonetic_candidates(prepared, reference):
+    prepared = dict(prepared)
+    reverse = {}
+    for node in list(prepared):
+        source, transform = node
+        if transform == "soundex" and source in reference.columns:
+            reverse[node] = soundex_code_index(reference, source)
+            prepared[node] = [(names[0], code) for code, names in reverse[node].items()]
+    return prepared, reverse
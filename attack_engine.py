@@ -0,0 +1,744 @@
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import operator
+import os
+import pickle
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from digest_index import SortedDigestIndex, build_digest_index
+from hash_backends import get_backend
+from matchkey_store import BinaryMatchKeys, hex_to_digests
+from matchkeys import constant_factor, factorize_normalized
+
+# Streaming dictionary attack on match keys.
+# The target key column is loaded once into a set of raw digests; candidate combinations are then
+# hashed and probed one by one, and only the hits are kept. Memory depends on the number of hits,
+# not on the size of the candidate space. Shared prefixes (fn, then fn + ln, ...) are hashed once:
+# each combination continues from a copy of its prefix's hash state (the SHA-256 midstate).
+
+# Target match keys of one key column, as raw digests in row order plus a set for probing.
+# Probes go through find_many, so the memory-mapped SortedDigestIndex (digest_index.py) can be
+# used in its place wherever an index is passed in.
+class TargetIndex:
+    def __init__(self, digests):
+        self.digests = list(digests)
+        self.digest_set = set(self.digests)
+
+    # From a column of hex digests (the CSV representation)
+    @classmethod
+    def from_hex(cls, hex_values):
+        hex_values = hex_values.tolist() if hasattr(hex_values, "tolist") else list(hex_values)
+        width = len(hex_values[0]) // 2 if hex_values and isinstance(hex_values[0], str) else 0
+        if width and all(isinstance(h, str) and len(h) == 2 * width for h in hex_values):
+            raw = bytes.fromhex("".join(hex_values))
+            return cls(raw[i:i + width] for i in range(0, len(raw), width))
+        return cls(bytes.fromhex(h) if isinstance(h, str) else b"" for h in hex_values)
+
+    # From a (rows, digest_size) uint8 array, e.g. BinaryMatchKeys.digests(name)
+    @classmethod
+    def from_digests(cls, digests):
+        digests = np.ascontiguousarray(digests)
+        size = digests.shape[1] if digests.ndim == 2 else 0
+        raw = digests.tobytes()
+        return cls(raw[i:i + size] for i in range(0, len(raw), size)) if size else cls([])
+
+    # One key column of a match-key store: a DataFrame of hex digests or an open .mkb file
+    @classmethod
+    def from_store(cls, store, name):
+        if isinstance(store, BinaryMatchKeys):
+            return cls.from_digests(store.digests(name))
+        return cls.from_hex(store[name])
+
+    def __contains__(self, digest):
+        return digest in self.digest_set
+
+    # Indices of the given digests that are in the index
+    def find_many(self, digests):
+        digest_set = self.digest_set
+        return [i for i, digest in enumerate(digests) if digest in digest_set]
+
+    def __len__(self):
+        return len(self.digests)
+
+    @property
+    def digest_size(self):
+        return len(self.digests[0]) if self.digests else 0
+
+    # Boolean mask of the target rows whose digest was found
+    def hit_mask(self, found):
+        return np.fromiter((d in found for d in self.digests), dtype=bool, count=len(self.digests))
+
+    # (hex digest, candidate values) for every target row that was hit, in row order
+    def matches(self, found):
+        return [(d.hex(), found[d]) for d in self.digests if d in found]
+
+    # (digest, number of target rows) of every distinct digest occurring at least min_count times,
+    # most frequent first (ties in row order)
+    def ranked_counts(self, min_count=1):
+        return [(digest, n) for digest, n in Counter(self.digests).most_common() if n >= min_count]
+
+# backend.finish without the Python-level call when the digest is not truncated
+def _finisher(backend):
+    return operator.methodcaller("digest") if backend.truncate is None else backend.finish
+
+# Candidates whose normalized form (after the transform) occurs again later in the list give the
+# same pre-images as that later one, which would win anyway: keep only the last occurrence of each
+def _last_occurrences(candidates):
+    last = {normalized: i for i, (_, normalized) in enumerate(candidates)}
+    return [candidate for i, candidate in enumerate(candidates) if last[candidate[1]] == i]
+
+# Candidate lists reduced to the last occurrence of each normalized form (same hits and winners)
+def distinct_candidates(lists):
+    return [_last_occurrences(candidates) for candidates in lists]
+
+# Encode the normalized side of every candidate list once: lists of (value, utf-8 bytes)
+def _encode(lists):
+    return [[(value, normalized.encode("utf-8")) for value, normalized in candidates] for candidates in lists]
+
+# Walk the product of the encoded lists below hash state h (already fed with the prefix whose
+# values are in values) and record hits into found, in product order. find_many is the target
+# index's batch probe; the digests of each innermost sweep are probed together.
+# Every prefix is hashed once; each further candidate continues from a copy of that midstate.
+def _probe_from(h, values, encoded, find_many, finish, found):
+    if not encoded:
+        digest = finish(h)
+        if find_many([digest]):
+            found[digest] = values
+        return found
+    head, rest = encoded[0], encoded[1:]
+    if rest:
+        for value, data in head:
+            m = h.copy()
+            m.update(data)
+            _probe_from(m, values + (value,), rest, find_many, finish, found)
+        return found
+    copy = h.copy
+    digests = []
+    for _, data in head:
+        m = copy()
+        m.update(data)
+        digests.append(finish(m))
+    for i in find_many(digests):
+        found[digests[i]] = values + (head[i][0],)
+    return found
+
+# Split the candidate space into about n_shards contiguous shards of the product order.
+# Shards are ranges of prefix combinations over the first few candidate lists (as many as it takes
+# to get n_shards prefixes), each followed by the full product of the remaining lists.
+def shard_candidates(lists, n_shards):
+    depth, n_prefixes = 0, 1
+    while depth < len(lists) and n_prefixes < n_shards:
+        n_prefixes *= len(lists[depth])
+        depth += 1
+    prefixes = list(itertools.product(*lists[:depth]))
+    step = max(1, -(-len(prefixes) // n_shards))
+    return [(prefixes[i:i + step], lists[depth:]) for i in range(0, len(prefixes), step)]
+
+# Target index shared by the worker processes of a sharded probe (set once per worker)
+_worker_index = None
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+def _probe_shard(prefixes, rest, backend):
+    encoded = _encode(rest)
+    found = {}
+    for prefix in prefixes:
+        h = backend.new()
+        for _, normalized in prefix:
+            h.update(normalized.encode("utf-8"))
+        _probe_from(h, tuple(value for value, _ in prefix), encoded, _worker_index.find_many, _finisher(backend), found)
+    return found
+
+# Hash every combination of candidate lists (one list of (value, normalized) per component) and
+# keep those whose digest is in the target index. Returns {digest: candidate values}; when several
+# combinations give the same digest the last one wins, like the former guessed_* dicts.
+# With workers > 1 the candidate space is sharded over a process pool; shard results are merged
+# in product order, so the result does not depend on the number of workers.
+def probe_candidates(lists, index, backend=None, workers=1):
+    backend = get_backend(backend)
+    workers = workers or os.cpu_count() or 1
+    lists = [_last_occurrences(candidates) for candidates in lists]
+    if workers == 1:
+        return _probe_from(backend.new(), (), _encode(lists), index.find_many, _finisher(backend), {})
+
+    found = {}
+    shards = shard_candidates(lists, 4 * workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,)) as pool:
+        futures = [pool.submit(_probe_shard, prefixes, rest, backend) for prefixes, rest in shards]
+        for future in futures:
+            found.update(future.result())
+    return found
+
+# Streaming attack on one key of a plan: {digest: candidate values} of every hit
+def probe_key(plan, name, prepared, index, backend=None, workers=1):
+    return probe_candidates(plan.candidate_lists(name, prepared), index, backend, workers)
+
+# Attack one key column of a store. Returns (matches, hits): the (hex digest, values) of every
+# target row that was hit, in row order, and their number. index (optional) is a prebuilt
+# target index for the column, e.g. a mapped SortedDigestIndex.
+def attack_key(plan, name, prepared, store, backend=None, workers=1, index=None):
+    index = index if index is not None else TargetIndex.from_store(store, name)
+    found = probe_key(plan, name, prepared, index, backend, workers)
+    return index.matches(found), index.hit_mask(found).sum()
+
+# Whole-plan attack.
+# Every key of a plan is attacked by the per-key engine from the shared prepared candidates (each
+# (column, transform) is normalized once by prepare_candidates, whichever keys use it). For
+# checkpoints and workers a key's candidate space is split into ranges of its first candidate list;
+# a later range holds later combinations of the product order, so merging ranges by their start
+# gives the same winner among colliding combinations as attack_key.
+
+# Probe one key over the range [start, stop) of its first candidate list; lists are reduced to
+# last occurrences. Returns {digest: candidate values} like probe_candidates.
+def _probe_range(lists, first, find_many, backend):
+    start, stop = first
+    return _probe_from(backend.new(), (), _encode([lists[0][start:stop]] + lists[1:]), find_many, _finisher(backend), {})
+
+def _probe_range_shard(name, lists, first, backend):
+    return _probe_range(lists, first, _worker_index[name].find_many, backend)
+
+# Merge the hits of one range into found ({digest: (range start, values)}): a later range wins
+def _merge_range_hits(found, first, hits):
+    for digest, values in hits.items():
+        if digest not in found or found[digest][0] < first[0]:
+            found[digest] = (first[0], values)
+
+# Checkpoints.
+# A long plan attack records, per key, the ranges of its first candidate list (the outer loop) that
+# are done, together with the hits found so far. The state is pickled to <checkpoint_dir>/<fingerprint>.ckpt
+# at most every checkpoint_seconds, atomically (temporary file, then rename); the fingerprint covers
+# the keys, their candidates, the backend and the target digests. A restarted attack with the same
+# fingerprint loads it and only walks the ranges that are not done. Hits are merged by rank, so the
+# result is the same as without interruption. The file is removed once the attack completes.
+
+CHECKPOINT_SECONDS = 60
+CHECKPOINT_SHARDS = 64  # first-list ranges per key when checkpointing
+CHECKPOINT_FORMAT = 2  # part of the fingerprint, so checkpoints of another layout are not loaded
+
+class AttackCheckpoint:
+    def __init__(self, path, interval=CHECKPOINT_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.done = {}
+        self.found = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            self.done, self.found = state["done"], state["found"]
+        self._saved = time.monotonic()
+
+    # Mark a range of a key's first candidate list as done; saves when the interval has passed
+    def record(self, name, first):
+        self.done.setdefault(name, []).append(first)
+        if time.monotonic() - self._saved >= self.interval:
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"done": self.done, "found": self.found}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._saved = time.monotonic()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# Digest of the distinct target digests of an index
+def _index_fingerprint(index):
+    if isinstance(index, SortedDigestIndex):
+        return hashlib.sha256(np.asarray(index.unique_digests).tobytes()).digest()
+    return hashlib.sha256(b"".join(sorted(index.digest_set))).digest()
+
+# Fingerprint of a plan attack: backend, keys, every candidate list and the target digests
+def _plan_fingerprint(plan, prepared, indices, backend):
+    h = hashlib.sha256(f"{CHECKPOINT_FORMAT}|{backend.cache_id}|{plan.scheme}".encode("utf-8"))
+    for key in plan.keys:
+        h.update(repr(key).encode("utf-8"))
+        for candidates in plan.candidate_lists(key.name, prepared):
+            h.update(len(candidates).to_bytes(8, "little"))
+            for value, normalized in candidates:
+                h.update(f"{value!r}\0{normalized}\0".encode("utf-8"))
+        h.update(_index_fingerprint(indices[key.name]))
+    return h.hexdigest()
+
+# Ranges [start, stop) of range(size) that no done range covers, in pieces of at most step
+def _pending_ranges(size, done, step):
+    covered = np.zeros(size, dtype=bool)
+    for start, stop in done:
+        covered[start:stop] = True
+    ranges = []
+    start = 0
+    while start < size:
+        if covered[start]:
+            start += 1
+            continue
+        stop = start + 1
+        while stop < size and not covered[stop] and stop - start < step:
+            stop += 1
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+# Attack every key of a plan. Returns {key name: (matches, hits)} like attack_key, with the same
+# hits and winner among colliding combinations. With workers > 1 each key is sharded over its
+# first candidate list, all keys through one process pool.
+# indices optionally maps key names to prebuilt target indexes; other keys are indexed from store.
+# checkpoint_dir (optional) makes the attack resumable, see AttackCheckpoint.
+def attack_plan(plan, prepared, store, backend=None, workers=1, indices=None, checkpoint_dir=None,
+                checkpoint_seconds=CHECKPOINT_SECONDS):
+    backend = get_backend(backend)
+    workers = workers or os.cpu_count() or 1
+    indices = dict(indices or {})
+    for name in plan.key_names:
+        if name not in indices:
+            indices[name] = TargetIndex.from_store(store, name)
+    found = {name: {} for name in plan.key_names}
+    checkpoint = None
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        fingerprint = _plan_fingerprint(plan, prepared, indices, backend)
+        checkpoint = AttackCheckpoint(os.path.join(checkpoint_dir, f"{fingerprint}.ckpt"), checkpoint_seconds)
+        found = checkpoint.found if checkpoint.found is not None else found
+        checkpoint.found = found
+
+    jobs = []
+    for name in plan.key_names:
+        lists = [_last_occurrences(candidates) for candidates in plan.candidate_lists(name, prepared)]
+        size = len(lists[0]) if lists else 0
+        if checkpoint is not None:
+            ranges = _pending_ranges(size, checkpoint.done.get(name, []),
+                                     max(1, -(-size // max(4 * workers, CHECKPOINT_SHARDS))))
+        elif workers > 1:
+            ranges = _pending_ranges(size, [], max(1, -(-size // (4 * workers))))
+        else:
+            ranges = [(0, size)] if size else []
+        jobs.extend((name, lists, first) for first in ranges)
+
+    if workers == 1:
+        for name, lists, first in jobs:
+            _merge_range_hits(found[name], first, _probe_range(lists, first, indices[name].find_many, backend))
+            if checkpoint is not None:
+                checkpoint.record(name, first)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(indices,)) as pool:
+            futures = [pool.submit(_probe_range_shard, name, lists, first, backend) for name, lists, first in jobs]
+            for (name, _, first), future in zip(jobs, futures):
+                _merge_range_hits(found[name], first, future.result())
+                if checkpoint is not None:
+                    checkpoint.record(name, first)
+    if checkpoint is not None:
+        checkpoint.remove()
+    results = {}
+    for name in plan.key_names:
+        hits = {digest: values for digest, (_, values) in found[name].items()}
+        results[name] = (indices[name].matches(hits), indices[name].hit_mask(hits).sum())
+    return results
+
+# Multi-target runs.
+# Several target stores with the same keys (e.g. one per state) are attacked in one run. Per key,
+# their digests are stacked into one target index: the rows of the first store, then those of the
+# second, and so on. Any attack mode then hashes every candidate once and probes it against all
+# targets together. Its (matches, hits) are split back per target by row range; a hit on one
+# target's row is the same as an attack on that target alone would give.
+
+# Stacked target indexes of several stores: ({key name: index}, [rows per store]). With index_dir
+# the indexes are mapped SortedDigestIndex files <index_dir>/<key name>.mkx, else TargetIndex.
+def stack_targets(stores, names, index_dir=None):
+    indices = {}
+    sizes = None
+    for name in names:
+        parts = [store.digests(name) if isinstance(store, BinaryMatchKeys) else hex_to_digests(store[name])
+                 for store in stores]
+        sizes = [len(part) for part in parts]
+        parts = [part for part in parts if len(part)]
+        digests = np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.uint8)
+        if index_dir is not None:
+            os.makedirs(index_dir, exist_ok=True)
+            indices[name] = build_digest_index(digests, os.path.join(index_dir, f"{name}.mkx"), bloom_bits_per_digest=10)
+        else:
+            indices[name] = TargetIndex.from_digests(digests)
+    return indices, sizes
+
+# Per-target results of an attack on stacked indexes: results is {key name: (matches, hits)} as
+# returned by attack_plan or collected from attack_key* over the stacked indexes, sizes the rows of
+# each target. Returns one {key name: (matches, hits)} per target, in stacking order.
+def split_targets(results, indices, sizes):
+    bounds = np.cumsum([0] + list(sizes))
+    split = [{} for _ in sizes]
+    for name, (matches, _) in results.items():
+        mask = indices[name].hit_mask({bytes.fromhex(digest): values for digest, values in matches})
+        start = 0
+        for target, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            hits = mask[lo:hi].sum()
+            split[target][name] = (matches[start:start + hits], hits)
+            start += hits
+    return split
+
+# Best-first (anytime) attack.
+# Instead of the full cube, candidate tuples are enumerated in decreasing order of their joint
+# empirical probability, taken as the product of the per-field frequencies, until a wall-clock
+# or hash-count budget runs out. Hits are produced as they are found.
+
+# Candidate lists of a key for best-first enumeration: one list of (value, encoded, log probability)
+# per component, most probable first. Candidates that transform to the same string (e.g. names with
+# one Soundex code) are merged: the most frequent value represents them and their frequencies add up.
+# frequencies maps reference columns to {value: relative frequency} (DistributionProfile.frequencies).
+def best_first_lists(plan, name, prepared, frequencies):
+    lists = []
+    for component, candidates in zip(plan.key(name).components, plan.candidate_lists(name, prepared)):
+        column_frequencies = frequencies.get(component.source or component.field, {})
+        merged = {}
+        for value, normalized in candidates:
+            p = float(column_frequencies.get(value, 0.0))
+            if normalized in merged:
+                first_value, total = merged[normalized]
+                merged[normalized] = (first_value, total + p)
+            else:
+                merged[normalized] = (value, p)
+        ranked = sorted(merged.items(), key=lambda item: -item[1][1])
+        lists.append([
+            (value, normalized.encode("utf-8"), math.log(p) if p > 0 else -math.inf)
+            for normalized, (value, p) in ranked
+        ])
+    return lists
+
+# Enumerate the product of best-first lists in decreasing joint probability and yield
+# (digest, values, probability) for every combination whose digest is in the target index.
+# Stops after max_seconds of wall-clock time or max_hashes digests (None = no limit); a digest is
+# reported once, for its most probable combination. Every combination is produced exactly once:
+# a tuple only ever advances the components at or after the one it last advanced.
+def probe_best_first(lists, index, backend=None, max_seconds=None, max_hashes=None, batch_size=1024):
+    backend = get_backend(backend)
+    if not lists or any(not candidates for candidates in lists):
+        return
+    digest = backend.digest
+    deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+    reported = set()
+    start = (0,) * len(lists)
+    heap = [(-sum(candidates[0][2] for candidates in lists), start, 0)]
+    n_hashes = 0
+    while heap:
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        # Pop, hash and probe up to batch_size combinations at a time (probes are batched)
+        n = batch_size if max_hashes is None else min(batch_size, max_hashes - n_hashes)
+        if n <= 0:
+            return
+        batch = []
+        while heap and len(batch) < n:
+            score, position, last = heapq.heappop(heap)
+            batch.append((score, [candidates[i] for candidates, i in zip(lists, position)]))
+            for j in range(last, len(lists)):
+                i = position[j] + 1
+                if i < len(lists[j]):
+                    successor = position[:j] + (i,) + position[j + 1:]
+                    heapq.heappush(heap, (-sum(c[k][2] for c, k in zip(lists, successor)), successor, j))
+        digests = [digest(b"".join(encoded for _, encoded, _ in combo)) for _, combo in batch]
+        n_hashes += len(batch)
+        for i in index.find_many(digests):
+            if digests[i] not in reported:
+                reported.add(digests[i])
+                score, combo = batch[i]
+                yield digests[i], tuple(value for value, _, _ in combo), math.exp(-score)
+
+# Best-first attack on one key column of a store, within a budget. on_hit(hex digest, values) is
+# called for every hit as it is found. Returns (matches, hits) like attack_key.
+def attack_key_best_first(plan, name, prepared, frequencies, store, backend=None,
+                          max_seconds=None, max_hashes=None, on_hit=None, index=None):
+    index = index if index is not None else TargetIndex.from_store(store, name)
+    lists = best_first_lists(plan, name, prepared, frequencies)
+    found = {}
+    for digest, values, _ in probe_best_first(lists, index, backend, max_seconds, max_hashes):
+        found[digest] = values
+        if on_hit is not None:
+            on_hit(digest.hex(), values)
+    return index.matches(found), index.hit_mask(found).sum()
+
+# Frequency alignment.
+# Match keys are deterministic and unsalted, so the digest counts of a key column mirror the counts
+# of the plaintext pre-images behind them. Target digests and reference pre-images are both ranked
+# by count and paired rank by rank: a first-pass estimate in O(n log n) without hashing candidates.
+# Pairs are guesses. Singleton counts carry no signal, so only digests occurring at least min_count
+# times are aligned; verify hashes the top reference pre-images to confirm or reject pairs.
+
+FrequencyAlignment = namedtuple("FrequencyAlignment",
+                                ["digest", "values", "target_count", "reference_count", "confirmed"])
+
+# Distinct pre-images of a key over the rows of a reference DataFrame, most frequent first (ties in
+# row order): [(pre-image, first row, count)]. Components are normalized as in match-key generation,
+# from the key's source columns; columns the reference lacks contribute "".
+def reference_frequencies(plan, name, df):
+    factors = []
+    for component in plan.key(name).components:
+        source = component.source or component.field
+        if source in df.columns:
+            factors.append(factorize_normalized(df[source], component.transform))
+        else:
+            factors.append(constant_factor(len(df)))
+    tuple_codes = np.zeros(len(df), dtype=np.int64)
+    for codes, uniques in factors:
+        _, tuple_codes = np.unique(tuple_codes * len(uniques) + codes, return_inverse=True)
+    _, first, counts = np.unique(tuple_codes, return_index=True, return_counts=True)
+
+    # Different tuples can concatenate to the same pre-image ("ab" + "c", "a" + "bc")
+    preimages = np.full(len(first), "", dtype=object)
+    for codes, uniques in factors:
+        preimages = preimages + np.array(uniques, dtype=object)[codes[first]]
+    totals = {}
+    for preimage, row, count in zip(preimages.tolist(), first.tolist(), counts.tolist()):
+        if preimage in totals:
+            totals[preimage][1] += count
+        else:
+            totals[preimage] = [row, count]
+    ranked = sorted(totals.items(), key=lambda item: (-item[1][1], item[1][0]))
+    return [(preimage, row, count) for preimage, (row, count) in ranked]
+
+# Source values of the given reference rows, as tuples in the key's component order
+def _reference_values(plan, name, df, rows):
+    columns = [df[source].iloc[rows].tolist() if source in df.columns else [""] * len(rows)
+               for source in (c.source or c.field for c in plan.key(name).components)]
+    return list(zip(*columns))
+
+# Align the target digests of one key with the pre-images of a reference DataFrame by frequency rank.
+# Returns (alignments, checked): a list of FrequencyAlignment, one per aligned rank, and the digests
+# of the top verify reference pre-images. confirmed is None unless the rank is among the top verify,
+# then whether the reference pre-image hashes to the aligned digest.
+# reference (optional) is the key's reference_frequencies, if already computed.
+def align_frequencies(plan, name, df, index, backend=None, min_count=2, verify=0, reference=None):
+    targets = index.ranked_counts(min_count)
+    if reference is None:
+        reference = reference_frequencies(plan, name, df)
+    checked = get_backend(backend).digest_many([preimage for preimage, _, _ in reference[:verify]])
+    reference = reference[:len(targets)]
+    values = _reference_values(plan, name, df, [row for _, row, _ in reference])
+    alignments = []
+    for rank, ((digest, target_count), (_, _, reference_count)) in enumerate(zip(targets, reference)):
+        confirmed = checked[rank] == digest if rank < len(checked) else None
+        alignments.append(FrequencyAlignment(digest, values[rank], target_count, reference_count, confirmed))
+    return alignments, checked
+
+# Frequency-alignment attack on one key column of a store. Verified reference pre-images that hash
+# to a target digest are hits; the other aligned pairs are unverified guesses, unless verification
+# rejected them. Returns (matches, hits, guesses): matches and hits like attack_key, over verified
+# hits only, and guesses the (hex digest, aligned values) of every other target row with a guess.
+def attack_key_frequency(plan, name, df, store, backend=None, min_count=2, verify=0, index=None):
+    index = index if index is not None else TargetIndex.from_store(store, name)
+    reference = reference_frequencies(plan, name, df)
+    alignments, checked = align_frequencies(plan, name, df, index, backend, min_count, verify, reference)
+    # The verified pre-images were hashed by the alignment; probe their digests against every target
+    found = {}
+    hits = index.find_many(checked) if checked else []
+    values = _reference_values(plan, name, df, [reference[i][1] for i in hits])
+    for i, hit_values in zip(hits, values):
+        found[checked[i]] = hit_values
+    guessed = {a.digest: a.values for a in alignments if a.confirmed is None and a.digest not in found}
+    return index.matches(found), index.hit_mask(found).sum(), index.matches(guessed)
+
+# Observed-tuple dictionary.
+# The product of per-column top-K lists is mostly combinations no record has (a top first name,
+# a top address and a top zip rarely belong together), and it never reaches rare real ones. Here
+# the candidates of a key are the distinct tuples of its source columns that co-occur in some
+# reference record, found in one grouped pass per key (reference_frequencies). Their number grows
+# linearly with the reference, not as K^n, and every tuple is hashed once, most frequent first.
+
+OBSERVED_BATCH_SIZE = 1 << 16  # pre-images hashed and probed per batch
+
+# Hash the observed pre-images of one key and probe them against the target index.
+# Returns {digest: source values of the first reference record with that pre-image}.
+def probe_observed(plan, name, df, index, backend=None, reference=None, batch_size=OBSERVED_BATCH_SIZE):
+    backend = get_backend(backend)
+    if reference is None:
+        reference = reference_frequencies(plan, name, df)
+    rows = {}
+    for start in range(0, len(reference), batch_size):
+        batch = reference[start:start + batch_size]
+        digests = backend.digest_many([preimage for preimage, _, _ in batch])
+        for i in index.find_many(digests):
+            rows[digests[i]] = batch[i][1]
+    return dict(zip(rows, _reference_values(plan, name, df, list(rows.values()))))
+
+# Observed-tuple attack on one key column of a store. Returns (matches, hits) like attack_key.
+def attack_key_observed(plan, name, df, store, backend=None, index=None):
+    index = index if index is not None else TargetIndex.from_store(store, name)
+    found = probe_observed(plan, name, df, index, backend)
+    return index.matches(found), index.hit_mask(found).sum()
+
+# Out-of-core sort-merge join.
+# For candidate spaces of 10^9 and more, the product is hashed into fixed-width (digest, rank)
+# records, rank being the combination's position in product order. Every run of up to run_size
+# records is sorted by digest and spilled to <work_dir>/run-NNNNN.npy. The runs are then
+# merge-joined, block by block, against the sorted target digests of a mapped .mkx index
+# (digest_index.py). Memory is bounded by one run and one block, and all I/O is sequential.
+# Runs are written atomically and the manifest fingerprints the attack, so an interrupted attack
+# resumes at the first missing run. Once the join completes the runs are deleted, unless the caller
+# keeps them (keep_runs) to join them again later.
+
+RUN_SIZE = 1 << 22  # records per sorted run (about 170 MB of SHA-256 records)
+JOIN_BLOCK_SIZE = 1 << 16
+MANIFEST_NAME = "manifest.json"
+
+# Every digest of the product of the encoded lists below hash state h, in product order
+def _digests_from(h, encoded, finish, out):
+    if not encoded:
+        out.append(finish(h))
+        return out
+    head, rest = encoded[0], encoded[1:]
+    if rest:
+        for _, data in head:
+            m = h.copy()
+            m.update(data)
+            _digests_from(m, rest, finish, out)
+        return out
+    copy = h.copy
+    for _, data in head:
+        m = copy()
+        m.update(data)
+        out.append(finish(m))
+    return out
+
+# Runs are ranges of prefixes over the first depth lists, each followed by the full product of the
+# remaining lists (suffix combinations), with as short a prefix as keeps a run within run_size.
+# Returns (depth, suffix, prefixes per run, number of runs).
+def _run_layout(sizes, run_size):
+    depth, suffix = len(sizes), 1
+    while depth and suffix * sizes[depth - 1] <= run_size:
+        depth -= 1
+        suffix *= sizes[depth]
+    per_run = max(1, run_size // suffix)
+    return depth, suffix, per_run, -(-math.prod(sizes[:depth]) // per_run)
+
+def _run_path(work_dir, run):
+    return os.path.join(work_dir, f"run-{run:05d}.npy")
+
+# Hash one run and write its records, sorted by digest (ranks ascending within a digest)
+def _write_run(work_dir, run, encoded, layout, backend):
+    depth, suffix, per_run, _ = layout
+    sizes = [len(candidates) for candidates in encoded[:depth]]
+    start = run * per_run
+    stop = min(math.prod(sizes), start + per_run)
+    finish = _finisher(backend)
+    digests = []
+    for p in range(start, stop):
+        h = backend.new()
+        for i, candidates in zip(np.unravel_index(p, sizes) if depth else (), encoded):
+            h.update(candidates[i][1])
+        _digests_from(h, encoded[depth:], finish, digests)
+    records = np.empty(len(digests), dtype=[("digest", f"V{backend.digest_size}"), ("rank", "<i8")])
+    records["digest"] = np.frombuffer(b"".join(digests), dtype=f"V{backend.digest_size}")
+    records["rank"] = np.arange(start * suffix, start * suffix + len(digests))
+    records = records[np.argsort(records["digest"], kind="stable")]
+    tmp_path = _run_path(work_dir, run) + ".tmp.npy"
+    np.save(tmp_path, records)
+    os.replace(tmp_path, _run_path(work_dir, run))
+    return run
+
+# Merge-join one sorted run against the target index: {digest: greatest rank} of its hits
+def _join_run(path, index, block_size=JOIN_BLOCK_SIZE):
+    records = np.load(path, mmap_mode="r")
+    hits = {}
+    for start in range(0, len(records), block_size):
+        block = np.asarray(records[start:start + block_size])
+        probes = np.ascontiguousarray(block["digest"]).view(np.uint8).reshape(len(block), -1)
+        for i in np.flatnonzero(index.positions(probes) >= 0).tolist():
+            hits[block["digest"][i].tobytes()] = int(block["rank"][i])
+    return hits
+
+# Fingerprint of an attack's runs: backend, run size and every candidate list
+def _run_fingerprint(encoded, backend, run_size):
+    h = hashlib.sha256(f"{backend.cache_id}|{run_size}".encode("utf-8"))
+    for candidates in encoded:
+        h.update(len(candidates).to_bytes(8, "little"))
+        for _, data in candidates:
+            h.update(len(data).to_bytes(4, "little") + data)
+    return h.hexdigest()
+
+# Hash every combination of candidate lists (already reduced to last occurrences) into sorted runs
+# under work_dir; returns the run paths in rank order. Runs already written by an interrupted call
+# with the same candidates are reused, runs of a different attack are discarded. With workers > 1
+# runs are hashed in a process pool.
+def write_sorted_runs(lists, work_dir, backend=None, run_size=RUN_SIZE, workers=1):
+    backend = get_backend(backend)
+    workers = workers or os.cpu_count() or 1
+    encoded = _encode(lists)
+    os.makedirs(work_dir, exist_ok=True)
+    layout = _run_layout([len(candidates) for candidates in lists], run_size)
+    n_runs = layout[3]
+
+    manifest_path = os.path.join(work_dir, MANIFEST_NAME)
+    fingerprint = _run_fingerprint(encoded, backend, run_size)
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    if manifest is None or manifest["fingerprint"] != fingerprint:
+        for name in os.listdir(work_dir):
+            if name.startswith("run-") and name.endswith(".npy"):
+                os.remove(os.path.join(work_dir, name))
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "runs": n_runs, "run_size": run_size}, f)
+
+    missing = [run for run in range(n_runs) if not os.path.exists(_run_path(work_dir, run))]
+    if workers == 1:
+        for run in missing:
+            _write_run(work_dir, run, encoded, layout, backend)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(_write_run, work_dir, run, encoded, layout, backend) for run in missing]:
+                future.result()
+    return [_run_path(work_dir, run) for run in range(n_runs)]
+
+# Delete the runs and manifest of write_sorted_runs, and work_dir itself once it is empty
+def remove_sorted_runs(work_dir):
+    for name in os.listdir(work_dir):
+        if (name.startswith("run-") and name.endswith(".npy")) or name == MANIFEST_NAME:
+            os.remove(os.path.join(work_dir, name))
+    if not os.listdir(work_dir):
+        os.rmdir(work_dir)
+
+# Candidate values of the combination at a rank of the product order
+def combination_values(lists, rank):
+    return tuple(candidates[i][0] for candidates, i in zip(lists, np.unravel_index(rank, [len(c) for c in lists])))
+
+# Hash every combination of candidate lists into sorted runs under work_dir and join them against
+# index (a SortedDigestIndex). Returns {digest: candidate values} like probe_candidates, with the
+# same winner among colliding combinations. The runs are removed once all of them are joined
+# (an interrupted join leaves them for the rerun), unless keep_runs is set.
+def probe_external(lists, index, work_dir, backend=None, run_size=RUN_SIZE, workers=1, keep_runs=False):
+    backend = get_backend(backend)
+    lists = [_last_occurrences(candidates) for candidates in lists]
+    if not lists or any(not candidates for candidates in lists) or index.digest_size != backend.digest_size:
+        return {}
+    runs = write_sorted_runs(lists, work_dir, backend, run_size, workers)
+
+    # Later runs hold later ranks, so the last hit per digest is the last combination in product order
+    ranks = {}
+    for path in runs:
+        ranks.update(_join_run(path, index))
+    if not keep_runs:
+        remove_sorted_runs(work_dir)
+    return {digest: combination_values(lists, rank) for digest, rank in ranks.items()}
+
+# Mapped target index of one key column of a store, built under work_dir if not given
+def _external_index(store, name, work_dir):
+    digests = store.digests(name) if isinstance(store, BinaryMatchKeys) else hex_to_digests(store[name])
+    os.makedirs(work_dir, exist_ok=True)
+    return build_digest_index(digests, os.path.join(work_dir, f"{name}.mkx"))
+
+# Out-of-core attack on one key column of a store; runs go to <work_dir>/<key name> and are kept
+# after the join only with keep_runs. Returns (matches, hits) like attack_key.
+def attack_key_external(plan, name, prepared, store, work_dir, backend=None, run_size=RUN_SIZE,
+                        workers=1, index=None, keep_runs=False):
+    index = index if isinstance(index, SortedDigestIndex) else _external_index(store, name, work_dir)
+    found = probe_external(plan.candidate_lists(name, prepared), index, os.path.join(work_dir, name),
+                           backend, run_size, workers, keep_runs)
+    return index.matches(found), index.hit_mask(found).sum()
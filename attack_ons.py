@@ -1,434 +1,256 @@
+import functools
+import os
+
 import pandas as pd
-import re
-import hashlib
+
+from attack_domains import domain_candidates, key_domain_sizes, key_entropy_bits, phonetic_candidates, split_plan
+from attack_engine import (attack_key_best_first, attack_key_external, attack_key_frequency, attack_plan, split_targets,
+                           stack_targets)
+from attack_propagation import propagate_plan
+from attack_results import HitStream, write_hits
+from digest_index import open_store_indexes
+from distribution_profile import load_profile
+from lookup_tables import attack_key_lookup
+from matchkey_store import open_store
+from matchkeys import ONS_PLAN
 
 # Define the file paths for the input CSVs
 df_original_file = "nc_voter_clean_dob.csv"
-df_ons_file = "ohio_voter_matchkeys_ons.csv"
-
-# Load the original dataset for attribute distribution analysis
-df_original = pd.read_csv(df_original_file)
-df_ons = pd.read_csv(df_ons_file)
-
-# Analyze top distributions for key fields used in ONS and Randall tokens
-top_first_names = df_original["first_name"].value_counts().head(100).index.tolist()
-top_last_names = df_original["last_name"].value_counts().head(100).index.tolist()
-top_dobs = df_original["dob"].value_counts().head(100).index.tolist()
-top_yobs = df_original["year_of_birth"].value_counts().head(100).index.astype(str).tolist()
-top_zips = df_original["zip"].value_counts().head(100).index.tolist()
-top_genders = df_original["gender"].value_counts().head(2).index.tolist()
-# top_emails = df_original["email"].value_counts().head(100).index.tolist()
-top_addresses = df_original["address"].value_counts().head(100).index.tolist()
-top_first_initials = df_original["first_initial"].value_counts().head(100).index.tolist()
-
-# Check if the 'email' column exists before analyzing its distribution
-if "email" in df_original.columns:
-    top_emails = df_original["email"].value_counts().head(100).index.tolist()
-else:
-    top_emails = []  # Leave it empty if the column doesn't exist
-
-# Helper functions
-def normalize(s):
-    return re.sub(r'\W+', '', str(s).lower().strip()) if pd.notnull(s) else ""
-
-def hash_fields(fields):
-    combined = "".join(normalize(f) for f in fields if f)
-    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
-
-def soundex_simple(name):
-    name = normalize(name)
-    if not name:
-        return ""
-    code = name[0].upper()
-    mappings = {"bfpv": "1", "cgjkqsxz": "2", "dt": "3", "l": "4", "mn": "5", "r": "6"}
-    for char in name[1:]:
-        for key, value in mappings.items():
-            if char in key:
-                if value != code[-1]:
-                    code += value
-    return (code + "000")[:4]
-
- # Attack mk1 (first + last + dob)
-guessed_ons_mk1 = {
-    hash_fields([fn, ln, dob]): (fn, ln, dob)
-    for fn in top_first_names
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk1"]
-mk1_matches = []
-for hash_val in df_ons["mk1"]:
-    if hash_val in guessed_ons_mk1:
-        matched_values = guessed_ons_mk1[hash_val]
-        mk1_matches.append((hash_val, matched_values))
-
-# Attack mk2 (first_initial + last + dob)
-guessed_ons_mk2 = {
-    hash_fields([fi, ln, dob]): (fi, ln, dob)
-    for fi in top_first_initials
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk2"]
-mk2_matches = []
-for hash_val in df_ons["mk2"]:
-    if hash_val in guessed_ons_mk2:
-        matched_values = guessed_ons_mk2[hash_val]
-        mk2_matches.append((hash_val, matched_values))
-
-# mk3 = first + zip + dob
-guessed_ons_mk3 = {
-    hash_fields([fn, zipc, dob]): (fn, zipc, dob)
-    for fn in top_first_names
-    for zipc in top_zips
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk3"]
-mk3_matches = []
-for hash_val in df_ons["mk5"]:
-    if hash_val in guessed_ons_mk3:
-        matched_values = guessed_ons_mk3[hash_val]
-        mk3_matches.append((hash_val, matched_values))
-
-# mk4 = soundex(last_name) + dob
-def soundex_simple(name):
-    name = normalize(name)
-    if not name:
-        return ""
-    code = name[0].upper()
-    mappings = {"bfpv": "1", "cgjkqsxz": "2", "dt": "3", "l": "4", "mn": "5", "r": "6"}
-    for char in name[1:]:
-        for key, value in mappings.items():
-            if char in key:
-                if value != code[-1]:
-                    code += value
-    return (code + "000")[:4]
-
-guessed_ons_mk4 = {
-    hash_fields([soundex_simple(ln), dob]): (ln, dob)
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk4"]
-mk4_matches = []
-for hash_val in df_ons["mk4"]:
-    if hash_val in guessed_ons_mk4:
-        matched_values = guessed_ons_mk4[hash_val]
-        mk4_matches.append((hash_val, matched_values))
-
-
-# mk5 = first[:3] + last + year_of_birth
-guessed_ons_mk5 = {
-    hash_fields([fn[:3], ln, yob]): (fn, ln, yob)
-    for fn in top_first_names
-    for ln in top_last_names
-    for yob in top_yobs
-}
-
-# Find actual hits in df_ons["mk5"]
-mk5_matches = []
-for hash_val in df_ons["mk5"]:
-    if hash_val in guessed_ons_mk5:
-        matched_values = guessed_ons_mk5[hash_val]
-        mk5_matches.append((hash_val, matched_values))
-
-# mk6 = first + soundex(last_name) + dob
-guessed_ons_mk6 = {
-    hash_fields([fn, soundex_simple(ln), dob]): (fn, ln, dob)
-    for fn in top_first_names
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk6"]
-mk6_matches = []
-for hash_val in df_ons["mk6"]:
-    if hash_val in guessed_ons_mk6:
-        matched_values = guessed_ons_mk6[hash_val]
-        mk6_matches.append((hash_val, matched_values))
-
-# mk7 = first_initial + soundex(last_name) + dob
-guessed_ons_mk7 = {
-    hash_fields([fi, soundex_simple(ln), dob]): (fi, ln, dob)
-    for fi in top_first_initials
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk7"]
-mk7_matches = []
-for hash_val in df_ons["mk7"]:
-    if hash_val in guessed_ons_mk7:
-        matched_values = guessed_ons_mk7[hash_val]
-        mk7_matches.append((hash_val, matched_values))
-
-# mk8 = first + last + dob[:7]
-guessed_ons_mk8 = {
-    hash_fields([fn, ln, dob[:7] if pd.notnull(dob) and len(dob) >= 7 else ""]): (fn, ln, dob)
-    for fn in top_first_names
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk8"]
-mk8_matches = []
-for hash_val in df_ons["mk8"]:
-    if hash_val in guessed_ons_mk8:
-        matched_values = guessed_ons_mk8[hash_val]
-        mk8_matches.append((hash_val, matched_values))
-
-# mk9 = first_initial + last_initial + year_of_birth
-guessed_ons_mk9 = {
-    hash_fields([fi, ln[0] if pd.notnull(ln) else "", yob]): (fi, ln, yob)
-    for fi in top_first_initials
-    for ln in top_last_names
-    for yob in top_yobs
-}
-
-# Find actual hits in df_ons["mk9"]
-mk9_matches = []
-for hash_val in df_ons["mk9"]:
-    if hash_val in guessed_ons_mk9:
-        matched_values = guessed_ons_mk9[hash_val]
-        mk9_matches.append((hash_val, matched_values))
-
-# mk10 = last_name + zip + year_of_birth
-guessed_ons_mk10 = {
-    hash_fields([ln, zipc, yob]): (ln, zipc, yob)
-    for ln in top_last_names
-    for zipc in top_zips
-    for yob in top_yobs
-}
-
-# Find actual hits in df_ons["mk10"]
-mk10_matches = []
-for hash_val in df_ons["mk10"]:
-    if hash_val in guessed_ons_mk10:
-        matched_values = guessed_ons_mk10[hash_val]
-        mk10_matches.append((hash_val, matched_values))
-
-# mk11 = first + year_of_birth + zip[:3]
-guessed_ons_mk11 = {
-    hash_fields([fn, yob, str(zipc)[:3] if pd.notnull(zipc) else ""]): (fn, yob, zipc)
-    for fn in top_first_names
-    for yob in top_yobs
-    for zipc in top_zips
-}
-
-# Find actual hits in df_ons["mk11"]
-mk11_matches = []
-for hash_val in df_ons["mk11"]:
-    if hash_val in guessed_ons_mk11:
-        matched_values = guessed_ons_mk11[hash_val]
-        mk11_matches.append((hash_val, matched_values))
-
-# mk12 = soundex(first_name) + last_name + dob
-guessed_ons_mk12 = {
-    hash_fields([soundex_simple(fn), ln, dob]): (fn, ln, dob)
-    for fn in top_first_names
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-# Find actual hits in df_ons["mk12"]
-mk12_matches = []
-for hash_val in df_ons["mk12"]:
-    if hash_val in guessed_ons_mk12:
-        matched_values = guessed_ons_mk12[hash_val]
-        mk12_matches.append((hash_val, matched_values))
-
-# mk13 = last_name + year_of_birth + zip[:3]
-guessed_ons_mk13 = {
-    hash_fields([ln, yob, str(zipc)[:3] if pd.notnull(zipc) else ""]): (ln, yob, zipc)
-    for ln in top_last_names
-    for yob in top_yobs
-    for zipc in top_zips
-}
-
-# Find actual hits in df_ons["mk13"]
-mk13_matches = []
-for hash_val in df_ons["mk13"]:
-    if hash_val in guessed_ons_mk13:
-        matched_values = guessed_ons_mk13[hash_val]
-        mk13_matches.append((hash_val, matched_values))
-
-# Compare to actual match keys
-ons_mk1_hits = df_ons["mk1"].isin(guessed_ons_mk1).sum()
-ons_mk2_hits = df_ons["mk2"].isin(guessed_ons_mk2).sum()
-ons_mk3_hits = df_ons["mk3"].isin(guessed_ons_mk3).sum()
-ons_mk4_hits = df_ons["mk4"].isin(guessed_ons_mk4).sum()
-ons_mk5_hits = df_ons["mk5"].isin(guessed_ons_mk5).sum()
-ons_mk6_hits = df_ons["mk6"].isin(guessed_ons_mk6).sum()
-ons_mk7_hits = df_ons["mk7"].isin(guessed_ons_mk7).sum()
-ons_mk8_hits = df_ons["mk8"].isin(guessed_ons_mk8).sum()
-ons_mk9_hits = df_ons["mk9"].isin(guessed_ons_mk9).sum()
-ons_mk10_hits = df_ons["mk10"].isin(guessed_ons_mk10).sum()
-ons_mk11_hits = df_ons["mk11"].isin(guessed_ons_mk11).sum()
-ons_mk12_hits = df_ons["mk12"].isin(guessed_ons_mk12).sum()
-ons_mk13_hits = df_ons["mk13"].isin(guessed_ons_mk13).sum()
-
-ons_attack_results = {
-        "mk1_hits": ons_mk1_hits,
-        "mk2_hits": ons_mk2_hits,
-        "mk3_hits": ons_mk3_hits,
-        "mk4_hits": ons_mk4_hits,
-        "mk5_hits": ons_mk5_hits,
-        "mk6_hits": ons_mk6_hits,
-        "mk7_hits": ons_mk7_hits,
-        "mk8_hits": ons_mk8_hits,
-        "mk9_hits": ons_mk9_hits,
-        "mk10_hits": ons_mk10_hits,
-        "mk11_hits": ons_mk11_hits,
-        "mk12_hits": ons_mk12_hits,
-        "mk13_hits": ons_mk13_hits
+df_ons_file = "ohio_voter_matchkeys_ons.csv"  # or the binary ohio_voter_matchkeys_ons.mkb
+
+# Reference columns profiled for candidates (see distribution_profile.py)
+profile_columns = ["first_name", "last_name", "dob", "year_of_birth", "zip", "gender", "email", "address", "first_initial"]
+
+# Digest backend the target match keys were generated with (see hash_backends.py)
+hash_backend = "sha256"
+
+# Candidates per reference column; the attack streams over them, so memory does not grow with top_k
+top_k = 100
+
+# Hit table (JSONL, see attack_results.py) for create_profiles.py, next to the text report
+hits_file = "ons_attack_hits.jsonl"
+
+# Best-first hits are also appended here as they are found (same records without target rows), so a
+# run killed before its budgets run out keeps them; create_profiles.py reads it like the hit table
+stream_file = "ons_attack_hits.stream.jsonl"
+
+# Worker processes the candidate space of each key is sharded over (1 = serial)
+workers = os.cpu_count()
+
+# Attack mode:
+#   "cube"        every top_k combination
+#   "best-first"  combinations from most to least probable (product of the field frequencies),
+#                 until the per-key budget below runs out
+#   "frequency"   pairs target digests and reference records by frequency rank, without brute-force
+#                 hashing (see attack_engine.attack_key_frequency); only pairs verified by hashing
+#                 count as hits, the others are reported apart as unverified guesses
+#   "external"    hashes the cube into sorted runs on disk and merge-joins them with the targets, for
+#                 candidate spaces larger than RAM (rerunning an interrupted attack reuses its runs;
+#                 they are deleted once joined unless keep_external_runs is set)
+#   "lookup"      hashes the cube once into a persistent lookup table, then only probes it
+#   "auto"        enumerates keys with at most exhaustive_threshold possible pre-images exhaustively
+#                 (every initial, year, date and Soundex code, see attack_domains.py) and samples
+#                 the others, best-first if a budget is set, else the cube
+attack_mode = "cube"
+budget_seconds = None  # wall-clock seconds per key, None = no limit
+budget_hashes = None  # digests per key, None = no limit
+frequency_min_count = 2  # align only digests shared by at least this many target rows
+frequency_verify = 1000  # hash the top reference records to confirm or reject their alignment
+external_dir = "ons_attack_runs"  # sorted runs and target indexes of the external mode
+external_run_size = 1 << 22  # records per sorted run
+keep_external_runs = False  # keep the sorted runs after the join (they are about 40 bytes per candidate)
+lookup_dir = "attack_lookup_tables"  # tables shared by every attack with the same scheme and candidates
+exhaustive_threshold = 3 * 10**8  # pre-images per key (about 3 minutes of SHA-256 per worker)
+domain_years = (1905, 2024)  # years of birth and dates the exhaustive domains cover
+
+# Resumable cube attacks (cube and auto modes): progress and hits are saved atomically to this
+# directory every checkpoint_seconds, and a rerun after a crash skips the finished ranges.
+# None = no checkpoints.
+checkpoint_dir = None  # e.g. "ons_attack_checkpoints"
+checkpoint_seconds = 60
+
+# Then link the keys of each target row: values recovered by one key restrict the candidates for
+# the row's other keys, drawn from the whole reference column (see attack_propagation.py)
+propagate_rows = False
+propagate_max_space = 10_000  # largest candidate space tried per key and row
+
+# Probe the targets through memory-mapped sorted indexes (.mkx files next to the match-key file,
+# see digest_index.py) instead of in-memory sets; for target files larger than memory
+use_mapped_index = False
+
+# Further target match-key files with the same keys, attacked in the same run: every candidate is
+# hashed once and probed against all targets together. Each file gets its own report and hit table,
+# named after it (<file stem>_attack_results.txt and <file stem>_attack_hits.jsonl).
+more_target_files = []
+
+# Attack Soundex components over every code observed in the reference data rather than the codes of
+# the top_k names; the hit table lists all reference names behind each recovered code
+phonetic_codes = False
+
+# Profiled columns of the original dataset, for the modes that need every record (read once)
+@functools.cache
+def load_reference():
+    return pd.read_csv(df_original_file, usecols=lambda column: column in profile_columns)
+
+if __name__ == "__main__":
+    # Attribute distributions of the original dataset (cached profile, recomputed only when the file changes)
+    profile = load_profile(df_original_file, profile_columns, top_k)
+
+    # Target match keys: a binary .mkb is memory-mapped; a CSV is loaded as hex digests, or read one key
+    # column at a time when mapped indexes hold the targets
+    df_ons = open_store(df_ons_file, lazy=use_mapped_index)
+
+    # Analyze top distributions for key fields used in ONS and Randall tokens
+    top_first_names = profile.top("first_name", top_k)
+    top_last_names = profile.top("last_name", top_k)
+    top_dobs = profile.top("dob", top_k)
+    top_yobs = [str(value) for value in profile.top("year_of_birth", top_k)]
+    top_zips = profile.top("zip", top_k)
+    top_genders = profile.top("gender", 2)
+    top_addresses = profile.top("address", top_k)
+    top_first_initials = profile.top("first_initial", top_k)
+    top_emails = profile.top("email", top_k)  # empty if the dataset has no 'email' column
+
+    # Candidate values per reference column, as used by the ONS key specification
+    candidates = {
+        "first_name": top_first_names,
+        "last_name": top_last_names,
+        "dob": top_dobs,
+        "year_of_birth": top_yobs,
+        "zip": top_zips,
+        "gender": top_genders,
+        "email": top_emails,
+        "address": top_addresses,
+        "first_initial": top_first_initials,
     }
 
-print(ons_attack_results)
-
-# Open a file to write the output
-output_file = "ons_attack_results.txt"
-with open(output_file, "w", encoding="utf-8") as f:
-    print("Used distribution: " + df_original_file, file=f)
-    print("Used matchkeys: " + df_ons_file, file=f)
-
-    # Write the ons_attack_results dictionary to the file
-    print(ons_attack_results, file=f)
-
-    # Print the matched combinations to the file
-    if ons_mk1_hits != 0:
-        print("Matched values for mk1 (first + last + dob):", file=f)
-        for hash_val, values in mk1_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk2_hits != 0:
-        print("Matched values for mk2 (first_initial + last + dob):", file=f)
-        for hash_val, values in mk2_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk3_hits != 0:
-        print("Matched values for mk3 (first + zip + dob):", file=f)
-        for hash_val, values in mk3_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk4_hits != 0:
-        print("Matched values for mk4 (soundex(last name) + dob):", file=f)
-        for hash_val, values in mk4_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)   
-
-    if ons_mk5_hits != 0:
-        print("Matched values for mk5 (first[:3] + last + year_of_birth):", file=f)
-        for hash_val, values in mk5_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk6_hits != 0:
-        print("Matched values for mk6 (first + soundex(last name) + dob):", file=f)
-        for hash_val, values in mk6_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk7_hits != 0:
-        print("Matched values for mk7 (first_initial + soundex(last name) + dob):", file=f)
-        for hash_val, values in mk7_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk8_hits != 0:
-        print("Matched values for mk8 (first + last + dob[:7]):", file=f)
-        for hash_val, values in mk8_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk9_hits != 0:
-        print("Matched values for mk9 (first_initial + last_initial + year_of_birth):", file=f)
-        for hash_val, values in mk9_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk10_hits != 0:
-        print("Matched values for mk10 (last_name + zip + year_of_birth):", file=f)
-        for hash_val, values in mk10_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk11_hits != 0:
-        print("Matched values for mk11 (first + year_of_birth + zip[:3]):", file=f)
-        for hash_val, values in mk11_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk12_hits != 0:
-        print("Matched values for mk12 (soundex(first_name) + last_name + dob):", file=f)
-        for hash_val, values in mk12_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-    if ons_mk13_hits != 0:
-        print("Matched values for mk13 (last_name + year_of_birth + zip[:3]):", file=f)
-        for hash_val, values in mk13_matches:
-            print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
-
-# Notify the user that the results have been saved
-print(f"Results have been written to {output_file}")
-
-""" # Print the matched combinations
-if ons_mk1_hits != 0:
-    print("Matched values for mk1 (first + last + dob):")
-    for hash_val, values in mk1_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk2_hits != 0:
-    print("Matched values for mk2 (first_initial + last + dob):")
-    for hash_val, values in mk2_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk3_hits != 0:
-    print("Matched values for mk3 (first + zip + dob):")
-    for hash_val, values in mk3_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk4_hits != 0:
-    print("Matched values for mk4 (soundex(last name) + dob):")
-    for hash_val, values in mk4_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")   
-
-if ons_mk5_hits != 0:
-    print("Matched values for mk5 (first[:3] + last + year_of_birth):")
-    for hash_val, values in mk5_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk6_hits != 0:
-    print("Matched values for mk6 (first + soundex(last name) + dob):")
-    for hash_val, values in mk6_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk7_hits != 0:
-    print("Matched values for mk7 (first_initial + soundex(last name) + dob):")
-    for hash_val, values in mk7_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk8_hits != 0:
-    print("Matched values for mk8 (first + last + dob[:7]):")
-    for hash_val, values in mk8_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk9_hits != 0:
-    print("Matched values for mk9 (first_initial + last_initial + year_of_birth):")
-    for hash_val, values in mk9_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk10_hits != 0:
-    print("Matched values for mk10 (last_name + zip + year_of_birth):")
-    for hash_val, values in mk10_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk11_hits != 0:
-    print("Matched values for mk11 (first + year_of_birth + zip[:3]):")
-    for hash_val, values in mk11_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk12_hits != 0:
-    print("Matched values for mk12 (soundex(first_name) + last_name + dob):")
-    for hash_val, values in mk12_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}")
-
-if ons_mk13_hits != 0:
-    print("Matched values for mk13 (last_name + year_of_birth + zip[:3]):")
-    for hash_val, values in mk13_matches:
-        print(f"Hash: {hash_val}  ←  Values: {values}") """
+    # Normalize and soundex every candidate once; keys sharing a component reuse it
+    prepared = ONS_PLAN.prepare_candidates(candidates)
+
+    # Phonetic keys over the whole observed Soundex code space (reverse indexes for the hit table)
+    alternatives = None
+    if phonetic_codes:
+        prepared, alternatives = phonetic_candidates(prepared, load_reference())
+
+    # Target indexes per key; None lets the engine build in-memory ones from df_ons
+    indices = None
+    if more_target_files:
+        # Every target stacked into one index per key (mapped under external_dir when needed)
+        target_files = [df_ons_file] + more_target_files
+        target_stores = [df_ons] + [open_store(path, lazy=use_mapped_index) for path in more_target_files]
+        indices, target_sizes = stack_targets(target_stores, ONS_PLAN.key_names,
+                                              external_dir if use_mapped_index or attack_mode == "external" else None)
+    elif use_mapped_index:
+        indices = open_store_indexes(df_ons_file, [key.name for key in ONS_PLAN.keys])
+
+    # Attack each key: stream its candidate combinations through the hasher and keep only target hits
+    ons_matches = {}
+    ons_attack_results = {}
+    ons_guesses = {}  # unverified frequency-rank pairings per key (frequency mode)
+    if attack_mode == "best-first":
+        frequencies = profile.frequencies(candidates)
+        with HitStream(stream_file) as stream:
+            for key in ONS_PLAN.keys:
+                ons_matches[key.name], ons_attack_results[f"{key.name}_hits"] = attack_key_best_first(
+                    ONS_PLAN, key.name, prepared, frequencies, df_ons, hash_backend,
+                    max_seconds=budget_seconds, max_hashes=budget_hashes, on_hit=stream.writer(key),
+                    index=indices[key.name] if indices else None)
+    elif attack_mode == "external":
+        for key in ONS_PLAN.keys:
+            ons_matches[key.name], ons_attack_results[f"{key.name}_hits"] = attack_key_external(
+                ONS_PLAN, key.name, prepared, df_ons, external_dir, hash_backend, run_size=external_run_size,
+                workers=workers, index=indices[key.name] if indices else None, keep_runs=keep_external_runs)
+    elif attack_mode == "lookup":
+        for key in ONS_PLAN.keys:
+            ons_matches[key.name], ons_attack_results[f"{key.name}_hits"] = attack_key_lookup(
+                ONS_PLAN, key.name, prepared, df_ons, lookup_dir, hash_backend, run_size=external_run_size,
+                workers=workers, index=indices[key.name] if indices else None)
+    elif attack_mode == "frequency":
+        df_original = load_reference()
+        for key in ONS_PLAN.keys:
+            ons_matches[key.name], ons_attack_results[f"{key.name}_hits"], ons_guesses[key.name] = attack_key_frequency(
+                ONS_PLAN, key.name, df_original, df_ons, hash_backend, min_count=frequency_min_count,
+                verify=frequency_verify, index=indices[key.name] if indices else None)
+    elif attack_mode == "auto":
+        df_original = load_reference()
+        domains = domain_candidates(ONS_PLAN, df_original, domain_years)
+        sizes = key_domain_sizes(ONS_PLAN, domains)
+        bits = key_entropy_bits(sizes)
+        exhaustive, sampled = split_plan(ONS_PLAN, sizes, exhaustive_threshold)
+        for key in ONS_PLAN.keys:
+            strategy = "exhaustive" if key in exhaustive.keys else "sampled"
+            print(f"{key.name}: {sizes[key.name]} pre-images ({bits[key.name]:.1f} bits), {strategy}")
+        results = attack_plan(exhaustive, domains, df_ons, hash_backend, workers=workers, indices=indices,
+                              checkpoint_dir=checkpoint_dir, checkpoint_seconds=checkpoint_seconds)
+        if budget_seconds is not None or budget_hashes is not None:
+            frequencies = profile.frequencies(candidates)
+            with HitStream(stream_file) as stream:
+                for key in sampled.keys:
+                    results[key.name] = attack_key_best_first(
+                        sampled, key.name, prepared, frequencies, df_ons, hash_backend,
+                        max_seconds=budget_seconds, max_hashes=budget_hashes, on_hit=stream.writer(key),
+                        index=indices[key.name] if indices else None)
+        else:
+            results.update(attack_plan(sampled, prepared, df_ons, hash_backend, workers=workers, indices=indices,
+                                       checkpoint_dir=checkpoint_dir, checkpoint_seconds=checkpoint_seconds))
+        for key in ONS_PLAN.keys:
+            ons_matches[key.name], ons_attack_results[f"{key.name}_hits"] = results[key.name]
+    else:
+        # Every key over the top_k cube; checkpoint_dir makes the run resumable
+        results = attack_plan(ONS_PLAN, prepared, df_ons, hash_backend, workers=workers,
+                              indices=indices, checkpoint_dir=checkpoint_dir, checkpoint_seconds=checkpoint_seconds)
+        for key in ONS_PLAN.keys:
+            ons_matches[key.name], ons_attack_results[f"{key.name}_hits"] = results[key.name]
+
+    # One result set per target file: (match-key file, store, matches, hits, guesses, hit table, report)
+    runs = [(df_ons_file, df_ons, ons_matches, ons_attack_results, ons_guesses, hits_file, "ons_attack_results.txt")]
+    if more_target_files:
+        stacked = {key.name: (ons_matches[key.name], ons_attack_results[f"{key.name}_hits"]) for key in ONS_PLAN.keys}
+        runs = []
+        guesses = split_targets({name: (matches, len(matches)) for name, matches in ons_guesses.items()}, indices, target_sizes)
+        for path, store, results, target_guesses in zip(target_files, target_stores,
+                                                        split_targets(stacked, indices, target_sizes), guesses):
+            stem = os.path.splitext(path)[0]
+            outputs = (f"{stem}_attack_hits.jsonl", f"{stem}_attack_results.txt") if runs else (hits_file, "ons_attack_results.txt")
+            runs.append((path, store, {name: matches for name, (matches, _) in results.items()},
+                         {f"{name}_hits": hits for name, (_, hits) in results.items()},
+                         {name: matches for name, (matches, _) in target_guesses.items()}, *outputs))
+
+    for target_file, df_target, target_matches, target_results, target_guesses, target_hits_file, output_file in runs:
+        if propagate_rows:
+            df_original = load_reference()
+            results = propagate_plan(ONS_PLAN, df_original, df_target, target_matches, hash_backend, max_space=propagate_max_space)
+            for key in ONS_PLAN.keys:
+                target_matches[key.name], target_results[f"{key.name}_hits"] = results[key.name]
+
+        print(target_results)
+
+        # Structured hit table (key, digest, target rows, recovered values; guesses marked unconfirmed)
+        write_hits(target_hits_file, ONS_PLAN, target_matches, df_target, alternatives, target_guesses)
+
+        # Open a file to write the output
+        with open(output_file, "w", encoding="utf-8") as f:
+            print("Used distribution: " + df_original_file, file=f)
+            print("Used matchkeys: " + target_file, file=f)
+
+            # Write the target's hit counts to the file
+            print(target_results, file=f)
+            if target_guesses:
+                print({f"{name}_guesses": len(guesses) for name, guesses in target_guesses.items()}, file=f)
+
+            # Print the matched combinations to the file
+            for key in ONS_PLAN.keys:
+                if target_results[f"{key.name}_hits"] != 0:
+                    print(f"Matched values for {key.name} ({key.label}):", file=f)
+                    for hash_val, values in target_matches[key.name]:
+                        print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
+
+            # Unverified frequency-rank pairings, apart from the hits (not recovered plaintext)
+            for key in ONS_PLAN.keys:
+                if target_guesses.get(key.name):
+                    print(f"Guessed values for {key.name} ({key.label}), unverified:", file=f)
+                    for hash_val, values in target_guesses[key.name]:
+                        print(f"Hash: {hash_val}  ←  Values: {values}", file=f)
+
+        # Notify the user that the results have been saved
+        print(f"Results have been written to {output_file}")
@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+
+from attack_engine import TargetIndex, probe_candidates
+from hash_backends import get_backend
+from matchkeys import apply_transform, normalize_values
+
+# Row-wise constraint propagation across the keys of a plan.
+# All keys of a target row come from one plaintext record, so a hit on a cheap key fixes part of
+# that record: mk9 gives both initials and the year of birth, mk4 the Soundex of the last name and
+# the dob. Such facts are kept per row as the normalized form of (field, transform) pairs. The
+# candidates for the row's other keys are then limited to the values consistent with them. They
+# are drawn from the whole reference column, not a global top-K. Each row's keys are solved
+# smallest search space first. Every hit adds facts (a recovered first name also fixes its
+# initial, prefix and Soundex), and the loop repeats until no key of the row makes progress.
+
+_ALL = None
+
+# Distinct values of one reference column, most frequent first, with their normalized form per
+# transform and, per transform and form, the positions of the values that have it
+class ColumnCandidates:
+    def __init__(self, values):
+        self.values = list(values)
+        self._forms = {}
+        self._positions = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def forms(self, transform):
+        if transform not in self._forms:
+            self._forms[transform] = normalize_values(apply_transform(transform, self.values))
+        return self._forms[transform]
+
+    def positions(self, transform, form):
+        if transform not in self._positions:
+            groups = {}
+            for i, f in enumerate(self.forms(transform)):
+                groups.setdefault(f, []).append(i)
+            self._positions[transform] = {f: np.array(p, dtype=np.int64) for f, p in groups.items()}
+        return self._positions[transform].get(form, np.empty(0, dtype=np.int64))
+
+# Candidate columns for every source column of a plan the reference DataFrame has.
+# top_k limits each column to its most frequent values (None = every distinct value).
+def reference_candidates(plan, df, top_k=None):
+    sources = {c.source or c.field for key in plan.keys for c in key.components}
+    return {source: ColumnCandidates(df[source].value_counts().head(top_k).index.tolist()
+                                     if top_k is not None else df[source].value_counts().index.tolist())
+            for source in sorted(sources) if source in df.columns}
+
+# Facts about one target row: {(field, transform): normalized form}
+class RowConstraints:
+    def __init__(self, plan):
+        self.facts = {}
+        self._transforms = {}
+        for key in plan.keys:
+            for c in key.components:
+                self._transforms.setdefault(c.field, set()).add(c.transform)
+
+    # Record the values recovered for a key. An untransformed value taken from the field's own
+    # column (not a derived one like first_initial) also fixes every other transform of that field;
+    # a transformed one (a Soundex code, an initial) only fixes its own.
+    def record(self, key, values):
+        for c, value in zip(key.components, values):
+            exact = c.transform is None and (c.source or c.field) == c.field
+            transforms = self._transforms[c.field] if exact else [c.transform]
+            for transform in transforms:
+                if (c.field, transform) not in self.facts:
+                    self.facts[(c.field, transform)] = normalize_values(apply_transform(transform, [value]))[0]
+
+    # Candidates of one component consistent with the facts: a single (value, form) pair when its
+    # form is known, else the positions of the matching values in the source column (_ALL = any)
+    def allowed(self, component, columns):
+        source = component.source or component.field
+        column = columns.get(source)
+        known = self.facts.get((component.field, component.transform))
+        if known is not None:
+            if column is not None:
+                positions = column.positions(component.transform, known)
+                if len(positions):
+                    return [(column.values[positions[0]], known)]
+            return [(known, known)]
+        if column is None:
+            return []
+        positions = _ALL
+        if source == component.field:
+            for (field, transform), form in self.facts.items():
+                if field == component.field:
+                    matching = column.positions(transform, form)
+                    positions = matching if positions is _ALL else np.intersect1d(positions, matching, assume_unique=True)
+        return positions
+
+def _space_size(allowed, column):
+    if isinstance(allowed, list):
+        return len(allowed)
+    return len(column) if allowed is _ALL else len(allowed)
+
+def _candidate_list(allowed, column, transform):
+    if isinstance(allowed, list):
+        return allowed
+    forms = column.forms(transform)
+    positions = range(len(column)) if allowed is _ALL else allowed.tolist()
+    return [(column.values[i], forms[i]) for i in positions]
+
+# Solve the keys of one target row. digests maps key names to the row's digest, solved holds the
+# {digest: values} found so far per key (shared by rows with equal digests, updated in place).
+# Returns the number of candidate combinations hashed.
+def propagate_row(plan, digests, columns, solved, backend=None, max_space=10_000, constraints=None):
+    constraints = constraints or RowConstraints(plan)
+    pending = [key for key in plan.keys if digests[key.name]]
+    n_hashed = 0
+    tried = {}  # key name -> number of facts when it was last probed without a hit
+    progress = True
+    while progress and pending:
+        progress = False
+        sizes = []
+        for key in pending:
+            values = solved[key.name].get(digests[key.name])
+            if values is not None:
+                constraints.record(key, values)
+                progress = True
+                continue
+            allowed = [constraints.allowed(c, columns) for c in key.components]
+            size = math.prod(_space_size(a, columns.get(c.source or c.field)) for a, c in zip(allowed, key.components))
+            if 0 < size <= max_space and tried.get(key.name) != len(constraints.facts):
+                sizes.append((size, key, allowed))
+        pending = [key for key in pending if digests[key.name] not in solved[key.name]]
+        if progress:
+            continue
+        for size, key, allowed in sorted(sizes, key=lambda item: item[0]):
+            lists = [_candidate_list(a, columns.get(c.source or c.field), c.transform)
+                     for a, c in zip(allowed, key.components)]
+            found = probe_candidates(lists, TargetIndex([digests[key.name]]), backend)
+            n_hashed += size
+            if found:
+                solved[key.name].update(found)
+                progress = True
+                break
+            tried[key.name] = len(constraints.facts)
+    return n_hashed
+
+# Extend the hits of a key-by-key attack (seeds: {key name: [(hex digest, values)]}, e.g. from
+# attack_plan) by row-wise propagation over the whole store. reference is the reference DataFrame
+# the candidates are drawn from. Returns {key name: (matches, hits)} like attack_plan, seeds included.
+def propagate_plan(plan, reference, store, seeds, backend=None, max_space=10_000, top_k=None, rows=None):
+    backend = get_backend(backend)
+    columns = reference_candidates(plan, reference, top_k)
+    indices = {key.name: TargetIndex.from_store(store, key.name) for key in plan.keys}
+    solved = {key.name: {bytes.fromhex(digest): values for digest, values in seeds.get(key.name, [])}
+              for key in plan.keys}
+    for row in range(len(indices[plan.keys[0].name])) if rows is None else rows:
+        digests = {name: index.digests[row] for name, index in indices.items()}
+        propagate_row(plan, digests, columns, solved, backend, max_space)
+    return {name: (index.matches(solved[name]), index.hit_mask(solved[name]).sum())
+            for name, index in indices.items()}
@@ -1,211 +1,261 @@
-import random
+import functools
+import os
+
 import pandas as pd
-import re
-import hashlib
+
+from attack_domains import domain_candidates, key_domain_sizes, key_entropy_bits, phonetic_candidates, split_plan
+from attack_engine import (attack_key_best_first, attack_key_external, attack_key_frequency, attack_key_observed,
+                           attack_plan, split_targets, stack_targets)
+from attack_propagation import propagate_plan
+from attack_results import HitStream, write_hits
+from digest_index import open_store_indexes
+from distribution_profile import load_profile
+from lookup_tables import attack_key_lookup
+from matchkey_store import open_store
+from matchkeys import RANDALL_PLAN
 
 # Define the file paths for the input CSVs
 df_original_file = "nc_voter_clean_dob.csv"
-df_randall_file = "ohio_voter_matchkeys_randall.csv"
-
-# Load the original dataset for attribute distribution analysis
-df_original = pd.read_csv(df_original_file)
-df_randall = pd.read_csv(df_randall_file)
-
-# Analyze top distributions for key fields used in ONS and Randall tokens
-top_first_names = df_original["first_name"].value_counts().head(100).index.tolist()
-top_last_names = df_original["last_name"].value_counts().head(100).index.tolist()
-top_dobs = df_original["dob"].value_counts().head(100).index.tolist()
-top_yobs = df_original["year_of_birth"].value_counts().head(100).index.astype(str).tolist()
-top_zips = df_original["zip"].value_counts().head(100).index.tolist()
-top_genders = df_original["gender"].value_counts().head(2).index.tolist()
-# top_emails = df_original["email"].value_counts().head(100).index.tolist()
-top_addresses = df_original["address"].value_counts().head(100).index.tolist()
-top_first_initials = df_original["first_initial"].value_counts().head(100).index.tolist()
-
-# Check if the 'email' column exists before analyzing its distribution
-if "email" in df_original.columns:
-    top_emails = df_original["email"].value_counts().head(100).index.tolist()
-else:
-    top_emails = []  # Leave it empty if the column doesn't exist
-
-# Helper functions
-def normalize(s):
-    return re.sub(r'\W+', '', str(s).lower().strip()) if pd.notnull(s) else ""
-
-def hash_fields(fields):
-    combined = "".join(normalize(f) for f in fields if f)
-    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
-
-def find_hit_combinations(df, column_name, guessed_dict):
-    matched = []
-    for h in df[column_name]:
-        if h in guessed_dict:
-            matched.append((h, guessed_dict[h]))
-    return matched
-
-# Attack mk_randall_1 (first + last + dob)
-guessed_randall_mk1 = {
-    hash_fields([fn, ln, dob]): (fn, ln, dob)
-    for fn in top_first_names
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-matches_mk1 = find_hit_combinations(df_randall, "mk_randall_1", guessed_randall_mk1)
-
-# Attack mk_randall_2 (first + zip + yob)
-guessed_randall_mk2 = {
-    hash_fields([fn, zipc, yob]): (fn, zipc, yob)
-    for fn in top_first_names
-    for zipc in top_zips
-    for yob in top_yobs
-}
-matches_mk2 = find_hit_combinations(df_randall, "mk_randall_2", guessed_randall_mk2)
-
-# mk_randall_3 = last_name + dob + gender
-guessed_randall_mk3 = {
-    hash_fields([ln, dob, g]): (ln, dob, g)
-    for ln in top_last_names
-    for dob in top_dobs
-    for g in top_genders
-}
-
-matches_mk3 = find_hit_combinations(df_randall, "mk_randall_3", guessed_randall_mk3)
-
-# mk_randall_4 = first_name + gender + zip
-guessed_randall_mk4 = {
-    hash_fields([fn, g, zipc]): (fn, g, zipc)
-    for fn in top_first_names
-    for g in top_genders
-    for zipc in top_zips
-}
-
-matches_mk4 = find_hit_combinations(df_randall, "mk_randall_4", guessed_randall_mk4)
-
-# mk_randall_5 = first + last + email
-guessed_randall_mk5 = {
-    hash_fields([fn, ln, email]): (fn, ln, email)
-    for fn in top_first_names
-    for ln in top_last_names
-    for email in top_emails
-}
-
-matches_mk5 = find_hit_combinations(df_randall, "mk_randall_5", guessed_randall_mk5)
-
-# mk_randall_6 = last + yob + zip
-guessed_randall_mk6 = {
-    hash_fields([ln, yob, zipc]): (ln, yob, zipc)
-    for ln in top_last_names
-    for yob in top_yobs
-    for zipc in top_zips
-}
-
-matches_mk6 = find_hit_combinations(df_randall, "mk_randall_6", guessed_randall_mk6)
-
-# mk_randall_7 = first_initial + last + dob
-guessed_randall_mk7 = {
-    hash_fields([fi, ln, dob]): (fi, ln, dob)
-    for fi in top_first_initials
-    for ln in top_last_names
-    for dob in top_dobs
-}
-
-matches_mk7 = find_hit_combinations(df_randall, "mk_randall_7", guessed_randall_mk7)
-
-# mk_randall_8 = first_name + address + zip
-guessed_randall_mk8 = {
-    hash_fields([fn, addr, zipc]): (fn, addr, zipc)
-    for fn in top_first_names
-    for addr in top_addresses
-    for zipc in top_zips
-}
-
-matches_mk8 = find_hit_combinations(df_randall, "mk_randall_8", guessed_randall_mk8)
-
-# mk_randall_9 = first_name + dob + email
-guessed_randall_mk9 = {
-    hash_fields([fn, dob, email]): (fn, dob, email)
-    for fn in top_first_names
-    for dob in top_dobs
-    for email in top_emails
-}
-
-matches_mk9 = find_hit_combinations(df_randall, "mk_randall_9", guessed_randall_mk9)
-
-# mk_randall_10 = last_name + gender + email
-guessed_randall_mk10 = {
-    hash_fields([ln, g, email]): (ln, g, email)
-    for ln in top_last_names
-    for g in top_genders
-    for email in top_emails
-}
-
-matches_mk10 = find_hit_combinations(df_randall, "mk_randall_10", guessed_randall_mk10)
-
-# Evaluate Randall guesses
-randall_hits = {
-    f"mk_randall_{i+1}": df_randall[f"mk_randall_{i+1}"].isin(eval(f"guessed_randall_mk{i+1}")).sum()
-    for i in range(10)
-}
-
-print(randall_hits)
-
-# Open a file to write the output
-output_file = "randall_attack_results.txt"
-with open(output_file, "w", encoding="utf-8") as f:
-    print("Used distribution: " + df_original_file, file=f)
-    print("Used matchkeys: " + df_randall_file, file=f)
-
-    # Write the ons_attack_results dictionary to the file
-    print(randall_hits, file=f)
-
-    # Print the matched combinations to the file
-    if matches_mk1:
-        print("Matches for mk_randall_1 (first + last + dob):", file=f)
-        for hash_val, values in matches_mk1:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk2:
-        print("Matches for mk_randall_2 (first + zip + yob):", file=f)
-        for hash_val, values in matches_mk2:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk3:
-        print("Matches for mk_randall_3 (last_name + dob + gender):", file=f)
-        for hash_val, values in matches_mk3:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk4:
-        print("Matches for mk_randall_4 (first_name + gender + zip):", file=f)
-        for hash_val, values in matches_mk4:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk5:
-        print("Matches for mk_randall_5 (first + last + email):", file=f)
-        for hash_val, values in matches_mk5:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk6:
-        print("Matches for mk_randall_6: (last + yob + zip)", file=f)
-        for hash_val, values in matches_mk6:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk7:
-        print("Matches for mk_randall_7: (first_initial + last + dob)", file=f)
-        for hash_val, values in matches_mk7:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk8:
-        print("Matches for mk_randall_8 (first_name + address + zip):", file=f)
-        for hash_val, values in matches_mk8:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk9:
-        print("Matches for mk_randall_9 (first_name + dob + email):", file=f)
-        for hash_val, values in matches_mk9:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
-
-    if matches_mk10:
-        print("Matches for mk_randall_10 (last_name + gender + email):", file=f)
-        for hash_val, values in matches_mk10:
-            print(f"Hash: {hash_val} ← Values: {values}", file=f)
\ No newline at end of file
+df_randall_file = "ohio_voter_matchkeys_randall.csv"  # or the binary ohio_voter_matchkeys_randall.mkb
+
+# Reference columns profiled for candidates (see distribution_profile.py)
+profile_columns = ["first_name", "last_name", "dob", "year_of_birth", "zip", "gender", "email", "address", "first_initial"]
+
+# Digest backend the target match keys were generated with (see hash_backends.py)
+hash_backend = "sha256"
+
+# Candidates per reference column; the attack streams over them, so memory does not grow with top_k
+top_k = 100
+
+# Hit table (JSONL, see attack_results.py) for create_profiles.py, next to the text report
+hits_file = "randall_attack_hits.jsonl"
+
+# Best-first hits are also appended here as they are found (same records without target rows), so a
+# run killed before its budgets run out keeps them; create_profiles.py reads it like the hit table
+stream_file = "randall_attack_hits.stream.jsonl"
+
+# Worker processes the candidate space of each key is sharded over (1 = serial)
+workers = os.cpu_count()
+
+# Attack mode:
+#   "cube"        every top_k combination
+#   "best-first"  combinations from most to least probable (product of the field frequencies),
+#                 until the per-key budget below runs out
+#   "frequency"   pairs target digests and reference records by frequency rank, without brute-force
+#                 hashing (see attack_engine.attack_key_frequency); only pairs verified by hashing
+#                 count as hits, the others are reported apart as unverified guesses
+#   "external"    hashes the cube into sorted runs on disk and merge-joins them with the targets, for
+#                 candidate spaces larger than RAM (rerunning an interrupted attack reuses its runs;
+#                 they are deleted once joined unless keep_external_runs is set)
+#   "lookup"      hashes the cube once into a persistent lookup table, then only probes it
+#   "observed"    hashes only the QID tuples that co-occur in some record of the original dataset
+#                 (one grouped pass per key), instead of the product of the top_k lists
+#   "auto"        enumerates keys with at most exhaustive_threshold possible pre-images exhaustively
+#                 (every initial, year, date and Soundex code, see attack_domains.py) and samples
+#                 the others, best-first if a budget is set, else the cube
+attack_mode = "cube"
+budget_seconds = None  # wall-clock seconds per key, None = no limit
+budget_hashes = None  # digests per key, None = no limit
+frequency_min_count = 2  # align only digests shared by at least this many target rows
+frequency_verify = 1000  # hash the top reference records to confirm or reject their alignment
+external_dir = "randall_attack_runs"  # sorted runs and target indexes of the external mode
+external_run_size = 1 << 22  # records per sorted run
+keep_external_runs = False  # keep the sorted runs after the join (they are about 40 bytes per candidate)
+lookup_dir = "attack_lookup_tables"  # tables shared by every attack with the same scheme and candidates
+exhaustive_threshold = 3 * 10**8  # pre-images per key (about 3 minutes of SHA-256 per worker)
+domain_years = (1905, 2024)  # years of birth and dates the exhaustive domains cover
+
+# Resumable cube attacks (cube and auto modes): progress and hits are saved atomically to this
+# directory every checkpoint_seconds, and a rerun after a crash skips the finished ranges.
+# None = no checkpoints.
+checkpoint_dir = None  # e.g. "randall_attack_checkpoints"
+checkpoint_seconds = 60
+
+# Then link the keys of each target row: values recovered by one key restrict the candidates for
+# the row's other keys, drawn from the whole reference column (see attack_propagation.py)
+propagate_rows = False
+propagate_max_space = 10_000  # largest candidate space tried per key and row
+
+# Probe the targets through memory-mapped sorted indexes (.mkx files next to the match-key file,
+# see digest_index.py) instead of in-memory sets; for target files larger than memory
+use_mapped_index = False
+
+# Further target match-key files with the same keys, attacked in the same run: every candidate is
+# hashed once and probed against all targets together. Each file gets its own report and hit table,
+# named after it (<file stem>_attack_results.txt and <file stem>_attack_hits.jsonl).
+more_target_files = []
+
+# Attack Soundex components over every code observed in the reference data rather than the codes of
+# the top_k names; the hit table lists all reference names behind each recovered code
+phonetic_codes = False
+
+# Profiled columns of the original dataset, for the modes that need every record (read once)
+@functools.cache
+def load_reference():
+    return pd.read_csv(df_original_file, usecols=lambda column: column in profile_columns)
+
+if __name__ == "__main__":
+    # Attribute distributions of the original dataset (cached profile, recomputed only when the file changes)
+    profile = load_profile(df_original_file, profile_columns, top_k)
+
+    # Target match keys: a binary .mkb is memory-mapped; a CSV is loaded as hex digests, or read one key
+    # column at a time when mapped indexes hold the targets
+    df_randall = open_store(df_randall_file, lazy=use_mapped_index)
+
+    # Analyze top distributions for key fields used in ONS and Randall tokens
+    top_first_names = profile.top("first_name", top_k)
+    top_last_names = profile.top("last_name", top_k)
+    top_dobs = profile.top("dob", top_k)
+    top_yobs = [str(value) for value in profile.top("year_of_birth", top_k)]
+    top_zips = profile.top("zip", top_k)
+    top_genders = profile.top("gender", 2)
+    top_addresses = profile.top("address", top_k)
+    top_first_initials = profile.top("first_initial", top_k)
+    top_emails = profile.top("email", top_k)  # empty if the dataset has no 'email' column
+
+    # Candidate values per reference column, as used by the Randall key specification
+    candidates = {
+        "first_name": top_first_names,
+        "last_name": top_last_names,
+        "dob": top_dobs,
+        "year_of_birth": top_yobs,
+        "zip": top_zips,
+        "gender": top_genders,
+        "email": top_emails,
+        "address": top_addresses,
+        "first_initial": top_first_initials,
+    }
+
+    # Normalize every candidate once; keys sharing a QID reuse it
+    prepared = RANDALL_PLAN.prepare_candidates(candidates)
+
+    # Phonetic keys over the whole observed Soundex code space (reverse indexes for the hit table)
+    alternatives = None
+    if phonetic_codes:
+        prepared, alternatives = phonetic_candidates(prepared, load_reference())
+
+    # Target indexes per key; None lets the engine build in-memory ones from df_randall
+    indices = None
+    if more_target_files:
+        # Every target stacked into one index per key (mapped under external_dir when needed)
+        target_files = [df_randall_file] + more_target_files
+        target_stores = [df_randall] + [open_store(path, lazy=use_mapped_index) for path in more_target_files]
+        indices, target_sizes = stack_targets(target_stores, RANDALL_PLAN.key_names,
+                                              external_dir if use_mapped_index or attack_mode == "external" else None)
+    elif use_mapped_index:
+        indices = open_store_indexes(df_randall_file, [key.name for key in RANDALL_PLAN.keys])
+
+    # Attack each key: stream its candidate combinations through the hasher and keep only target hits
+    randall_matches = {}
+    randall_hits = {}
+    randall_guesses = {}  # unverified frequency-rank pairings per key (frequency mode)
+    if attack_mode == "best-first":
+        frequencies = profile.frequencies(candidates)
+        with HitStream(stream_file) as stream:
+            for key in RANDALL_PLAN.keys:
+                randall_matches[key.name], randall_hits[key.name] = attack_key_best_first(
+                    RANDALL_PLAN, key.name, prepared, frequencies, df_randall, hash_backend,
+                    max_seconds=budget_seconds, max_hashes=budget_hashes, on_hit=stream.writer(key),
+                    index=indices[key.name] if indices else None)
+    elif attack_mode == "external":
+        for key in RANDALL_PLAN.keys:
+            randall_matches[key.name], randall_hits[key.name] = attack_key_external(
+                RANDALL_PLAN, key.name, prepared, df_randall, external_dir, hash_backend, run_size=external_run_size,
+                workers=workers, index=indices[key.name] if indices else None, keep_runs=keep_external_runs)
+    elif attack_mode == "lookup":
+        for key in RANDALL_PLAN.keys:
+            randall_matches[key.name], randall_hits[key.name] = attack_key_lookup(
+                RANDALL_PLAN, key.name, prepared, df_randall, lookup_dir, hash_backend, run_size=external_run_size,
+                workers=workers, index=indices[key.name] if indices else None)
+    elif attack_mode == "frequency":
+        df_original = load_reference()
+        for key in RANDALL_PLAN.keys:
+            randall_matches[key.name], randall_hits[key.name], randall_guesses[key.name] = attack_key_frequency(
+                RANDALL_PLAN, key.name, df_original, df_randall, hash_backend, min_count=frequency_min_count,
+                verify=frequency_verify, index=indices[key.name] if indices else None)
+    elif attack_mode == "observed":
+        df_original = load_reference()
+        for key in RANDALL_PLAN.keys:
+            randall_matches[key.name], randall_hits[key.name] = attack_key_observed(
+                RANDALL_PLAN, key.name, df_original, df_randall, hash_backend,
+                index=indices[key.name] if indices else None)
+    elif attack_mode == "auto":
+        df_original = load_reference()
+        domains = domain_candidates(RANDALL_PLAN, df_original, domain_years)
+        sizes = key_domain_sizes(RANDALL_PLAN, domains)
+        bits = key_entropy_bits(sizes)
+        exhaustive, sampled = split_plan(RANDALL_PLAN, sizes, exhaustive_threshold)
+        for key in RANDALL_PLAN.keys:
+            strategy = "exhaustive" if key in exhaustive.keys else "sampled"
+            print(f"{key.name}: {sizes[key.name]} pre-images ({bits[key.name]:.1f} bits), {strategy}")
+        results = attack_plan(exhaustive, domains, df_randall, hash_backend, workers=workers, indices=indices,
+                              checkpoint_dir=checkpoint_dir, checkpoint_seconds=checkpoint_seconds)
+        if budget_seconds is not None or budget_hashes is not None:
+            frequencies = profile.frequencies(candidates)
+            with HitStream(stream_file) as stream:
+                for key in sampled.keys:
+                    results[key.name] = attack_key_best_first(
+                        sampled, key.name, prepared, frequencies, df_randall, hash_backend,
+                        max_seconds=budget_seconds, max_hashes=budget_hashes, on_hit=stream.writer(key),
+                        index=indices[key.name] if indices else None)
+        else:
+            results.update(attack_plan(sampled, prepared, df_randall, hash_backend, workers=workers, indices=indices,
+                                       checkpoint_dir=checkpoint_dir, checkpoint_seconds=checkpoint_seconds))
+        for key in RANDALL_PLAN.keys:
+            randall_matches[key.name], randall_hits[key.name] = results[key.name]
+    else:
+        # Every key over the top_k cube; checkpoint_dir makes the run resumable
+        results = attack_plan(RANDALL_PLAN, prepared, df_randall, hash_backend, workers=workers,
+                              indices=indices, checkpoint_dir=checkpoint_dir, checkpoint_seconds=checkpoint_seconds)
+        for key in RANDALL_PLAN.keys:
+            randall_matches[key.name], randall_hits[key.name] = results[key.name]
+
+    # One result set per target file: (match-key file, store, matches, hits, guesses, hit table, report)
+    runs = [(df_randall_file, df_randall, randall_matches, randall_hits, randall_guesses, hits_file, "randall_attack_results.txt")]
+    if more_target_files:
+        stacked = {key.name: (randall_matches[key.name], randall_hits[key.name]) for key in RANDALL_PLAN.keys}
+        runs = []
+        guesses = split_targets({name: (matches, len(matches)) for name, matches in randall_guesses.items()}, indices, target_sizes)
+        for path, store, results, target_guesses in zip(target_files, target_stores,
+                                                        split_targets(stacked, indices, target_sizes), guesses):
+            stem = os.path.splitext(path)[0]
+            outputs = (f"{stem}_attack_hits.jsonl", f"{stem}_attack_results.txt") if runs else (hits_file, "randall_attack_results.txt")
+            runs.append((path, store, {name: matches for name, (matches, _) in results.items()},
+                         {name: hits for name, (_, hits) in results.items()},
+                         {name: matches for name, (matches, _) in target_guesses.items()}, *outputs))
+
+    for target_file, df_target, target_matches, target_hits, target_guesses, target_hits_file, output_file in runs:
+        if propagate_rows:
+            df_original = load_reference()
+            results = propagate_plan(RANDALL_PLAN, df_original, df_target, target_matches, hash_backend, max_space=propagate_max_space)
+            for key in RANDALL_PLAN.keys:
+                target_matches[key.name], target_hits[key.name] = results[key.name]
+
+        print(target_hits)
+
+        # Structured hit table (key, digest, target rows, recovered values; guesses marked unconfirmed)
+        write_hits(target_hits_file, RANDALL_PLAN, target_matches, df_target, alternatives, target_guesses)
+
+        # Open a file to write the output
+        with open(output_file, "w", encoding="utf-8") as f:
+            print("Used distribution: " + df_original_file, file=f)
+            print("Used matchkeys: " + target_file, file=f)
+
+            # Write the target's hit counts to the file
+            print(target_hits, file=f)
+            if target_guesses:
+                print({f"{name}_guesses": len(guesses) for name, guesses in target_guesses.items()}, file=f)
+
+            # Print the matched combinations to the file
+            for key in RANDALL_PLAN.keys:
+                if target_matches[key.name]:
+                    print(f"Matches for {key.name} ({key.label}):", file=f)
+                    for hash_val, values in target_matches[key.name]:
+                        print(f"Hash: {hash_val} ← Values: {values}", file=f)
+
+            # Unverified frequency-rank pairings, apart from the hits (not recovered plaintext)
+            for key in RANDALL_PLAN.keys:
+                if target_guesses.get(key.name):
+                    print(f"Guessed values for {key.name} ({key.label}), unverified:", file=f)
+                    for hash_val, values in target_guesses[key.name]:
+                        print(f"Hash: {hash_val} ← Values: {values}", file=f)
@@ -0,0 +1,112 @@
+import itertools
+import json
+
+import pandas as pd
+
+from json_encoding import json_default
+from matchkey_store import BinaryMatchKeys
+from matchkeys import apply_transform, normalize_values
+
+# Structured attack results: one JSON object per line and recovered digest,
+#   {"key": "mk1", "digest": "<hex>", "rows": [target row indices],
+#    "fields": ["first_name", "last_name", "dob"], "values": ["JOHN", "SMITH", "1985-01-01"]}
+# plus "alternatives" (per component, all values behind the recovered form) when reverse indexes
+# are given, e.g. every reference name with the recovered Soundex code, and "confirmed": false on
+# unverified guesses (frequency-rank pairings that were not hashed, see attack_key_frequency).
+# fields are the reference columns the values were drawn from, in hashing order.
+# Records are grouped by key (plan order) and ordered by their first target row within a key.
+
+HITS_SUFFIX = ".jsonl"
+BATCH_SIZE = 10_000
+
+# Hex digests of one key column of a match-key store (DataFrame of hex digests or open .mkb file)
+def _store_column(store, name):
+    if isinstance(store, BinaryMatchKeys):
+        return store.hex(name)
+    return store[name].tolist()
+
+# Hit records of one key: matches is the list of (hex digest, values) per hit target row,
+# as returned by attack_key / attack_plan. alternatives (optional) maps (source, transform) nodes to
+# {normalized form: values}, e.g. the Soundex reverse indexes of attack_domains.phonetic_candidates;
+# records then list, per component, every value behind the recovered form (null for other components).
+# confirmed=False marks the records as unverified guesses.
+def key_hit_records(key, matches, store, alternatives=None, confirmed=True):
+    values_by_digest = dict(matches)
+    rows = {}
+    for row, digest in enumerate(_store_column(store, key.name)):
+        if digest in values_by_digest:
+            rows.setdefault(digest, []).append(row)
+    fields = [c.source or c.field for c in key.components]
+    nodes = [(c.source or c.field, c.transform) for c in key.components]
+    for digest, digest_rows in rows.items():
+        record = {"key": key.name, "digest": digest, "rows": digest_rows, "fields": fields,
+                  "values": list(values_by_digest[digest])}
+        if alternatives:
+            record["alternatives"] = [
+                alternatives[node].get(normalize_values(apply_transform(node[1], [value]))[0])
+                if node in alternatives else None
+                for node, value in zip(nodes, record["values"])
+            ]
+        if not confirmed:
+            record["confirmed"] = False
+        yield record
+
+# Write the hits of every key of a plan to a JSONL hit table, BATCH_SIZE records per write.
+# matches maps key names to their (hex digest, values) lists; alternatives as for key_hit_records.
+# guesses (optional) maps key names to unverified (hex digest, values) lists, written after the
+# key's hits with "confirmed": false. Returns the number of records.
+def write_hits(path, plan, matches, store, alternatives=None, guesses=None):
+    n_records = 0
+    with open(path, "w", encoding="utf-8") as f:
+        batch = []
+        for key in plan.keys:
+            records = itertools.chain(
+                key_hit_records(key, matches.get(key.name, []), store, alternatives),
+                key_hit_records(key, (guesses or {}).get(key.name, []), store, alternatives, confirmed=False))
+            for record in records:
+                batch.append(json.dumps(record, ensure_ascii=False, default=json_default))
+                if len(batch) >= BATCH_SIZE:
+                    f.write("\n".join(batch) + "\n")
+                    n_records += len(batch)
+                    batch = []
+        if batch:
+            f.write("\n".join(batch) + "\n")
+            n_records += len(batch)
+    return n_records
+
+# Hit stream of an anytime attack: one record per hit as it is found, like the hit table but without
+# "rows" ({"key", "digest", "fields", "values"}), flushed at once so a killed run keeps its hits.
+# writer(key) gives the on_hit(hex digest, values) callback of attack_key_best_first for one key.
+class HitStream:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+
+    def writer(self, key):
+        fields = [c.source or c.field for c in key.components]
+
+        def on_hit(digest, values):
+            record = {"key": key.name, "digest": digest, "fields": fields, "values": list(values)}
+            self._file.write(json.dumps(record, ensure_ascii=False, default=json_default) + "\n")
+            self._file.flush()
+        return on_hit
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Iterate over the records of a hit table
+def read_hits(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+# Hit table as a DataFrame with columns key, digest, rows, fields and values
+def load_hits(path):
+    return pd.DataFrame(list(read_hits(path)), columns=["key", "digest", "rows", "fields", "values"])
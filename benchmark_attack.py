@@ -0,0 +1,44 @@
+import math
+import sys
+import tempfile
+import time
+
+from attack_engine import attack_key, attack_plan
+from benchmark_matchkeys import make_synthetic_voters
+from matchkeys import ONS_PLAN, generate_ons_13_matchkeys
+
+# Benchmark of the dictionary attack engines on synthetic data: candidates are the top-k values of a
+# synthetic reference dataset, targets the ONS keys of another synthetic dataset.
+# Usage: python benchmark_attack.py [top_k] [target rows]
+
+COLUMNS = ["first_name", "last_name", "dob", "year_of_birth", "zip", "gender", "address", "first_initial"]
+
+def make_attack_inputs(top_k, n_targets):
+    reference = make_synthetic_voters(200_000, seed=1)
+    reference["dob"] = reference["year_of_birth"] + "-01-01"
+    candidates = {column: reference[column].value_counts().head(top_k).index.tolist() for column in COLUMNS}
+    targets = generate_ons_13_matchkeys(make_synthetic_voters(n_targets, seed=2))
+    return ONS_PLAN.prepare_candidates(candidates), targets
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    top_k = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    n_targets = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    prepared, targets = make_attack_inputs(top_k, n_targets)
+    n_candidates = sum(math.prod(len(c) for c in ONS_PLAN.candidate_lists(name, prepared)) for name in ONS_PLAN.key_names)
+    print(f"top-{top_k} candidates, {n_targets:,} target rows, {n_candidates:,} candidate combinations over 13 keys")
+
+    per_key, per_key_time = timed(lambda: {name: attack_key(ONS_PLAN, name, prepared, targets) for name in ONS_PLAN.key_names})
+    plan, plan_time = timed(lambda: attack_plan(ONS_PLAN, prepared, targets))
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        resumable, resumable_time = timed(lambda: attack_plan(ONS_PLAN, prepared, targets, checkpoint_dir=checkpoint_dir))
+    for name in ONS_PLAN.key_names:
+        assert per_key[name][0] == plan[name][0] == resumable[name][0], f"{name}: plan attack differs from the per-key attack"
+    for label, seconds in [("per key (attack_key)", per_key_time), ("plan (attack_plan)", plan_time),
+                           ("plan, checkpointed (64 ranges/key)", resumable_time)]:
+        print(f"{label + ':':<36}{seconds:8.2f}s  ({n_candidates / seconds:,.0f} candidates/s)")
+    print("hits: " + ", ".join(f"{name}={hits}" for name, (_, hits) in plan.items()))
@@ -0,0 +1,46 @@
+import sys
+import time
+
+from benchmark_matchkeys import make_synthetic_voters
+from hash_backends import get_backend
+from matchkeys import normalize
+
+# Micro-benchmark of the digest backends on realistic match-key pre-images.
+# Usage: python benchmark_hashing.py [pre-images]
+
+BACKENDS = ["sha256", "sha256:16", "blake2b", "blake2b:32", "blake2s", "hmac-sha256"]
+
+# Pre-images shaped like ONS/Randall keys: name + name + date, name + year + zip, name + address + zip
+def make_preimages(n):
+    df = make_synthetic_voters(max(n // 3, 1)).fillna("")
+    rows = df.to_dict("records")
+    preimages = []
+    for r in rows:
+        preimages.append(normalize(r["first_name"]) + normalize(r["last_name"]) + normalize(r["year_of_birth"] + "-01-01"))
+        preimages.append(normalize(r["first_name"]) + normalize(r["year_of_birth"]) + normalize(r["zip"]))
+        preimages.append(normalize(r["first_name"]) + normalize(r["address"]) + normalize(r["zip"]))
+    return preimages[:n]
+
+# Best of a few runs, in hashes per second
+def throughput(func, preimages, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(preimages)
+        best = min(best, time.perf_counter() - start)
+    return len(preimages) / best
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    preimages = make_preimages(n)
+    mean_length = sum(len(p) for p in preimages) / len(preimages)
+    print(f"{len(preimages):,} pre-images, mean length {mean_length:.1f} characters")
+    print(f"{'backend':<14}{'bytes':>6}{'raw digests/s':>16}{'hex digests/s':>16}{'cost vs sha256':>16}")
+
+    baseline = None
+    for spec in BACKENDS:
+        backend = get_backend(spec, key="benchmark-key" if spec.startswith("hmac") else None)
+        raw = throughput(backend.digest_many, preimages)
+        hexed = throughput(backend.hexdigest_many, preimages)
+        baseline = baseline or raw
+        print(f"{spec:<14}{backend.digest_size:>6}{raw:>16,.0f}{hexed:>16,.0f}{baseline / raw:>15.2f}x")
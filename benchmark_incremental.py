@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import matchkeys
+from benchmark_matchkeys import make_synthetic_voters
+from matchkey_incremental import update_matchkeys_incremental
+from matchkey_store import load_matchkeys, write_matchkeys
+from matchkeys import ONS_PLAN, generate_ons_13_matchkeys
+
+# Benchmark of incremental match-key refreshes: the time of a refresh against the number of
+# changed rows, next to a full regenerate-and-write, for the .mkb and CSV stores.
+# Usage: python benchmark_incremental.py [rows]
+
+CHANGED_ROWS = [0, 100, 1_000, 10_000, 50_000]
+
+def clear_caches():
+    for cache in (matchkeys.normalize_cache, matchkeys.soundex_cache, matchkeys.digest_cache):
+        cache.clear()
+
+# Give n random rows a last name no earlier run has hashed
+def edit_rows(df, n, tag, rng):
+    df = df.copy()
+    rows = rng.choice(len(df), size=min(n, len(df)), replace=False)
+    df.loc[rows, "last_name"] = [f"{tag}edit{row}" for row in rows]
+    return df
+
+def timed(func):
+    clear_caches()
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+def run(df, store_path):
+    refresh = lambda frame: update_matchkeys_incremental(frame, store_path, generate_ons_13_matchkeys, ONS_PLAN.fields, scheme="ons")
+    t_full, _ = timed(lambda: write_matchkeys(store_path + ".full" + os.path.splitext(store_path)[1],
+                                              generate_ons_13_matchkeys(df.copy()), scheme="ons", extra={"hash": "sha256"}))
+    print(f"  Full regenerate + write: {t_full:8.2f} s")
+    refresh(df)
+
+    rng = np.random.default_rng(0)
+    for step, n_changed in enumerate(CHANGED_ROWS):
+        df = edit_rows(df, n_changed, f"s{step}", rng)
+        seconds, stats = timed(lambda: refresh(df))
+        assert stats["recomputed"] == n_changed, stats
+        print(f"  Refresh, {n_changed:>7,} rows edited:  {seconds:8.2f} s  ({seconds / t_full:.0%} of full)")
+
+    extra = make_synthetic_voters(CHANGED_ROWS[-1] // 5, seed=7)
+    extra["last_name"] = [f"appended{i}" for i in range(len(extra))]
+    df = pd.concat([df, extra], ignore_index=True)
+    seconds, stats = timed(lambda: refresh(df))
+    assert stats["recomputed"] == len(extra), stats
+    print(f"  Refresh, {len(extra):>7,} rows appended: {seconds:8.2f} s  ({seconds / t_full:.0%} of full)")
+
+    expected = generate_ons_13_matchkeys(df.copy())
+    assert (load_matchkeys(store_path).fillna("").to_numpy() == expected.fillna("").to_numpy()).all()
+    print("  Refreshed store identical to a full regenerate")
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    df = make_synthetic_voters(n_rows).reset_index(drop=True)
+    print(f"Synthetic dataset: {n_rows} rows; every refresh fingerprints all rows")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for suffix in (".mkb", ".csv"):
+            print(f"ONS keys, {suffix} store:")
+            run(df, os.path.join(tmp_dir, "keys" + suffix))
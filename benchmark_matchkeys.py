@@ -0,0 +1,119 @@
+import io
+import random
+import sys
+import time
+
+import pandas as pd
+
+import matchkeys
+from matchkey_spec import RANDALL_QID_SETS
+from matchkeys import generate_ons_13_matchkeys, generate_randall_match_keys, hash_fields, normalize
+
+# Benchmark of the match-key generators on a synthetic voter-like dataset.
+# Usage: python benchmark_matchkeys.py [rows]
+
+# Build a synthetic dataset with a realistic amount of repetition in names, years and zips
+def make_synthetic_voters(n_rows, seed=42):
+    rng = random.Random(seed)
+    syllables = ["an", "na", "ma", "ri", "jo", "el", "la", "ke", "son", "ber", "mil", "ler", "st", "ev", "ch", "o'", "-"]
+
+    def make_name():
+        name = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).strip("-'")
+        return name.capitalize() or "Ng"
+
+    first_names = [make_name() for _ in range(2000)]
+    last_names = [make_name() for _ in range(8000)]
+    zips = [f"{rng.randint(10000, 99999)}" for _ in range(1500)]
+    weights_fn = [1 / (i + 1) for i in range(len(first_names))]
+    weights_ln = [1 / (i + 1) for i in range(len(last_names))]
+
+    rows = {
+        "first_name": rng.choices(first_names, weights_fn, k=n_rows),
+        "last_name": rng.choices(last_names, weights_ln, k=n_rows),
+        "year_of_birth": [str(rng.randint(1920, 2005)) for _ in range(n_rows)],
+        "zip": rng.choices(zips, k=n_rows),
+        "gender": rng.choices(["M", "F"], k=n_rows),
+        "address": [f"{rng.randint(1, 999)} {rng.choice(last_names)} st" for _ in range(n_rows)],
+    }
+    df = pd.DataFrame(rows, dtype=object)
+    # Sprinkle in missing values like the real extracts have
+    for column in df.columns:
+        df.loc[df.sample(frac=0.01, random_state=rng.randint(0, 10**6)).index, column] = None
+    df["first_initial"] = df["first_name"].str[0].str.upper()
+    df["dob"] = df["year_of_birth"]
+    return df.astype("str").where(df.notna())
+
+# Former character-by-character implementation, kept here as the reference for equality checks
+def soundex_simple_reference(name):
+    name = normalize(name)
+    if not name:
+        return ""
+    code = name[0].upper()
+    mappings = {"bfpv": "1", "cgjkqsxz": "2", "dt": "3", "l": "4", "mn": "5", "r": "6"}
+    for char in name[1:]:
+        for key, value in mappings.items():
+            if char in key:
+                if value != code[-1]:
+                    code += value
+    return (code + "000")[:4]
+
+# Former row-wise implementation, kept here as the reference for equality checks
+def generate_ons_13_matchkeys_rowwise(df):
+    df["dob"] = df["year_of_birth"].apply(lambda y: f"{y}-01-01" if pd.notnull(y) else "")
+
+    df["mk1"] = df.apply(lambda x: hash_fields([x["first_name"], x["last_name"], x["dob"]]), axis=1)
+    df["mk2"] = df.apply(lambda x: hash_fields([x["first_name"][0] if pd.notnull(x["first_name"]) else "", x["last_name"], x["dob"]]), axis=1)
+    df["mk3"] = df.apply(lambda x: hash_fields([x["first_name"], x["zip"], x["dob"]]), axis=1)
+    df["mk4"] = df.apply(lambda x: hash_fields([soundex_simple_reference(x["last_name"]), x["dob"]]), axis=1)
+    df["mk5"] = df.apply(lambda x: hash_fields([x["first_name"][:3] if pd.notnull(x["first_name"]) else "", x["last_name"], x["year_of_birth"]]), axis=1)
+    df["mk6"] = df.apply(lambda x: hash_fields([x["first_name"], soundex_simple_reference(x["last_name"]), x["dob"]]), axis=1)
+    df["mk7"] = df.apply(lambda x: hash_fields([x["first_name"][0] if pd.notnull(x["first_name"]) else "", soundex_simple_reference(x["last_name"]), x["dob"]]), axis=1)
+    df["mk8"] = df.apply(lambda x: hash_fields([x["first_name"], x["last_name"], x["dob"][:7] if pd.notnull(x["dob"]) and len(x["dob"]) >= 7 else ""]), axis=1)
+    df["mk9"] = df.apply(lambda x: hash_fields([
+        x["first_name"][0] if pd.notnull(x["first_name"]) else "",
+        x["last_name"][0] if pd.notnull(x["last_name"]) else "",
+        x["year_of_birth"]]), axis=1)
+    df["mk10"] = df.apply(lambda x: hash_fields([x["last_name"], x["zip"], x["year_of_birth"]]), axis=1)
+    df["mk11"] = df.apply(lambda x: hash_fields([x["first_name"], x["year_of_birth"], x["zip"][:3] if pd.notnull(x["zip"]) else ""]), axis=1)
+    df["mk12"] = df.apply(lambda x: hash_fields([soundex_simple_reference(x["first_name"]), x["last_name"], x["dob"]]), axis=1)
+    df["mk13"] = df.apply(lambda x: hash_fields([x["last_name"], x["year_of_birth"], x["zip"][:3] if pd.notnull(x["zip"]) else ""]), axis=1)
+    return df[[f"mk{i}" for i in range(1, 14)]]
+
+# Former row-wise Randall implementation (reads the dataset without dtype, like the script)
+def generate_randall_match_keys_rowwise(df):
+    for i, qids in enumerate(RANDALL_QID_SETS):
+        col_name = f"mk_randall_{i+1}"
+        df[col_name] = df.apply(lambda row: hash_fields([row.get(qid, "") for qid in qids]), axis=1)
+    return df[[f"mk_randall_{i+1}" for i in range(len(RANDALL_QID_SETS))]]
+
+# Time a generator and return (seconds, result)
+def timed(generator, df):
+    start = time.perf_counter()
+    result = generator(df.copy())
+    return time.perf_counter() - start, result
+
+# Run both implementations, check equality and print the timings
+def compare(label, rowwise, columnar, df):
+    t_rowwise, keys_rowwise = timed(rowwise, df)
+    for cache in (matchkeys.normalize_cache, matchkeys.soundex_cache, matchkeys.digest_cache):
+        cache.clear()
+    t_columnar, keys_columnar = timed(columnar, df)
+
+    pd.testing.assert_frame_equal(keys_rowwise, keys_columnar, check_dtype=False)
+    print(f"{label}: output identical to the row-wise implementation")
+    print(f"  Row-wise: {t_rowwise:8.2f} s  ({len(df) / t_rowwise:,.0f} rows/s)")
+    print(f"  Columnar: {t_columnar:8.2f} s  ({len(df) / t_columnar:,.0f} rows/s)")
+    print(f"  Speedup:  {t_rowwise / t_columnar:8.1f}x")
+    hashed = ", ".join(f"{name}={keys_columnar[name].nunique():,}" for name in keys_columnar.columns)
+    print(f"  Distinct pre-images hashed: {hashed}")
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    df = make_synthetic_voters(n_rows)
+    print(f"Synthetic dataset: {n_rows} rows")
+
+    compare("ONS mk1..mk13", generate_ons_13_matchkeys_rowwise, generate_ons_13_matchkeys, df)
+
+    # The Randall script reads without dtype, so years and zips arrive as numbers (floats when missing)
+    df_inferred = pd.read_csv(io.StringIO(df.to_csv(index=False)))
+    compare("Randall mk_randall_1..10", generate_randall_match_keys_rowwise, generate_randall_match_keys, df_inferred)
@@ -0,0 +1,42 @@
+import sys
+import time
+
+import numpy as np
+
+import matchkeys
+from benchmark_matchkeys import make_synthetic_voters, soundex_simple_reference
+from check_soundex import EDGE_CASES, check, regression_names
+from matchkeys import soundex_batch, soundex_simple
+
+# Benchmark of the table-driven Soundex against the former implementation (after the regression
+# check of check_soundex.py and a check on the synthetic names).
+# Usage: python benchmark_soundex.py [names]
+
+def timed(func, names, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        matchkeys.soundex_cache.clear()
+        start = time.perf_counter()
+        func(names)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    df = make_synthetic_voters(n)
+    names = df["last_name"].tolist()
+
+    check(EDGE_CASES)
+    check(regression_names())
+    check(names + df["first_name"].tolist() + df["address"].tolist())
+    print("Table-driven Soundex matches the reference on all regression names")
+
+    reference = timed(lambda values: [soundex_simple_reference(v) for v in values], names)
+    table = timed(lambda values: [soundex_simple(v) for v in values], names)
+    batch = timed(soundex_batch, names)
+    distinct = len(set(n for n in names if isinstance(n, str)))
+    print(f"{len(names):,} names, {distinct:,} distinct")
+    print(f"reference (per row):     {reference:8.3f}s")
+    print(f"table-driven (per row):  {table:8.3f}s  ({reference / table:.1f}x)")
+    print(f"soundex_batch:           {batch:8.3f}s  ({reference / batch:.1f}x)")
+    assert np.array_equal(soundex_batch(names), np.array([soundex_simple_reference(v) if isinstance(v, str) else "" for v in names], dtype=object))
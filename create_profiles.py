@@ -1,3 +1,7 @@
+import ast
+
+from attack_results import HITS_SUFFIX, read_hits
+
 # Function to generate a unique key for profiles
 def generate_profile_key(first_name, last_name, year_of_birth):
     return f"{first_name.lower()}_{last_name.lower()}_{year_of_birth}"
@@ -17,14 +21,19 @@ def merge_profiles(existing_profile, new_data):
                   f"{existing_profile['date_of_birth']} vs {new_data['date_of_birth']}")
     return existing_profile
 
-# Main function to process input and output profiles
-def consolidate_profiles(input_file, output_file):
-    # Dictionary to store unified profiles
-    profiles = {}
+# Read (match key, hash, plain values) triples from an attack result.
+# .jsonl files are the structured hit tables written by the attacks (see attack_results.py);
+# anything else is parsed as the older "Hash: ... ← Values: (...)" text report.
+def read_attack_hits(input_file):
+    if input_file.endswith(HITS_SUFFIX):
+        for record in read_hits(input_file):
+            if record.get("confirmed", True):  # unverified frequency guesses are not plaintext
+                yield record["key"], record["digest"], tuple(record["values"])
+        return
 
-    # Read and parse the input file
     with open(input_file, "r", encoding="utf-8") as f:  # Specify UTF-8 encoding
         current_match_key = None
+        guessed = False
         for line in f:
             line = line.strip()
             if not line:
@@ -33,62 +42,77 @@ def consolidate_profiles(input_file, output_file):
             # Check if the line indicates a new match key
             if line.startswith("Matched values for"):
                 current_match_key = line.split("(")[0].split()[-1]
+                guessed = False
+                continue
+            if line.startswith("Guessed values for"):
+                guessed = True  # unverified frequency guesses are not plaintext
+                continue
+            if line.startswith("Matches for"):
+                guessed = False
                 continue
 
             # Parse hash and plain text values
-            if line.startswith("Hash:"):
+            if line.startswith("Hash:") and not guessed:
                 parts = line.split("←")
                 hash_val = parts[0].split("Hash:")[1].strip()
-                plain_values = eval(parts[1].split("Values:")[1].strip())  # Convert string tuple to actual tuple
+                plain_values = ast.literal_eval(parts[1].split("Values:")[1].strip())  # Convert string tuple to actual tuple
+                yield current_match_key, hash_val, plain_values
 
-                # Handle different match key formats
-                if len(plain_values) == 4:  # Format: (first_name, last_name, year_of_birth, day_of_birth)
-                    first_name, last_name, year_of_birth, date_of_birth = plain_values
-                    date_of_birth = f"{year_of_birth}-{date_of_birth}"  # Construct full date of birth in yyyy-mm-dd format
-                    key = generate_profile_key(first_name, last_name, year_of_birth)
-                    new_data = {
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "year_of_birth": year_of_birth,
-                        "date_of_birth": date_of_birth,  # Store full date of birth
-                        "hash": hash_val,  # Add the hash as the representative hash
-                    }
-                elif len(plain_values) == 3:  # Format: (first_name, last_name, dob or year_of_birth)
-                    first_name, last_name, third_value = plain_values
-                    if "-" in third_value:  # Likely a full DOB (yyyy-mm-dd)
-                        dob = third_value
-                        year_of_birth = dob.split("-")[0]  # Extract year from DOB
-                        key = generate_profile_key(first_name, last_name, year_of_birth)
-                        new_data = {
-                            "first_name": first_name,
-                            "last_name": last_name,
-                            "year_of_birth": year_of_birth,
-                            "date_of_birth": dob,  # Use full DOB
-                            "hash": hash_val,  # Add the hash as the representative hash
-                        }
-                    elif third_value.isdigit() and len(third_value) == 4:  # Likely a year of birth (yyyy)
-                        year_of_birth = third_value
-                        key = generate_profile_key(first_name, last_name, year_of_birth)
-                        new_data = {
-                            "first_name": first_name,
-                            "last_name": last_name,
-                            "year_of_birth": year_of_birth,
-                            "date_of_birth": None,  # Date of birth not available
-                            "hash": hash_val,  # Add the hash as the representative hash
-                        }
-                    else:
-                        print(f"Unknown format for match key {current_match_key}: {plain_values}")
-                        continue
-                else:
-                    print(f"Unknown format for match key {current_match_key}: {plain_values}")
-                    continue
+# Main function to process input and output profiles
+def consolidate_profiles(input_file, output_file):
+    # Dictionary to store unified profiles
+    profiles = {}
+
+    # Read the hits of every match key
+    for current_match_key, hash_val, plain_values in read_attack_hits(input_file):
+        # Handle different match key formats
+        if len(plain_values) == 4:  # Format: (first_name, last_name, year_of_birth, day_of_birth)
+            first_name, last_name, year_of_birth, date_of_birth = plain_values
+            date_of_birth = f"{year_of_birth}-{date_of_birth}"  # Construct full date of birth in yyyy-mm-dd format
+            key = generate_profile_key(first_name, last_name, year_of_birth)
+            new_data = {
+                "first_name": first_name,
+                "last_name": last_name,
+                "year_of_birth": year_of_birth,
+                "date_of_birth": date_of_birth,  # Store full date of birth
+                "hash": hash_val,  # Add the hash as the representative hash
+            }
+        elif len(plain_values) == 3:  # Format: (first_name, last_name, dob or year_of_birth)
+            first_name, last_name, third_value = plain_values
+            if "-" in third_value:  # Likely a full DOB (yyyy-mm-dd)
+                dob = third_value
+                year_of_birth = dob.split("-")[0]  # Extract year from DOB
+                key = generate_profile_key(first_name, last_name, year_of_birth)
+                new_data = {
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "year_of_birth": year_of_birth,
+                    "date_of_birth": dob,  # Use full DOB
+                    "hash": hash_val,  # Add the hash as the representative hash
+                }
+            elif third_value.isdigit() and len(third_value) == 4:  # Likely a year of birth (yyyy)
+                year_of_birth = third_value
+                key = generate_profile_key(first_name, last_name, year_of_birth)
+                new_data = {
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "year_of_birth": year_of_birth,
+                    "date_of_birth": None,  # Date of birth not available
+                    "hash": hash_val,  # Add the hash as the representative hash
+                }
+            else:
+                print(f"Unknown format for match key {current_match_key}: {plain_values}")
+                continue
+        else:
+            print(f"Unknown format for match key {current_match_key}: {plain_values}")
+            continue
 
-                # Merge into profiles or create a new profile
-                if key in profiles:
-                    profiles[key] = merge_profiles(profiles[key], new_data)
-                else:
-                    # Create a new profile if no match is found
-                    profiles[key] = new_data
+        # Merge into profiles or create a new profile
+        if key in profiles:
+            profiles[key] = merge_profiles(profiles[key], new_data)
+        else:
+            # Create a new profile if no match is found
+            profiles[key] = new_data
 
     # Write the unified profiles to the output file
     with open(output_file, "w", encoding="utf-8") as f:  # Specify UTF-8 encoding for output
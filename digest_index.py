@@ -0,0 +1,231 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from matchkey_store import hex_to_digests, is_binary_path, open_matchkeys
+
+# Sorted, memory-mapped index of one target match-key column (.mkx).
+#
+# The distinct digests of the column are stored sorted, as fixed-width binary records, next to
+# their first 8 bytes read as a big-endian number (stored as little-endian uint64, the search key
+# for np.searchsorted). Target rows are
+# kept as a row-id permutation grouped by digest: rows[offsets[i]:offsets[i + 1]] hold the rows
+# of the i-th digest. An optional Bloom filter over the digests lets most misses be rejected
+# before the binary search. Everything after the 4096-byte header is np.memmap-ed read-only, so
+# several attack processes share one copy through the page cache.
+#
+# Layout: b"MKX1" + space-padded JSON header, then the sections listed in header["sections"]
+# as {name: [offset, length in bytes]}, each 8-byte aligned.
+
+MAGIC = b"MKX1"
+HEADER_SIZE = 4096
+INDEX_SUFFIX = ".mkx"
+BLOOM_HASHES = 7
+
+def _pack_header(header):
+    payload = MAGIC + json.dumps(header).encode("utf-8")
+    if len(payload) > HEADER_SIZE:
+        raise ValueError(f"Digest index header exceeds {HEADER_SIZE} bytes")
+    return payload.ljust(HEADER_SIZE, b" ")
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path} is not a digest index")
+    return json.loads(raw[len(MAGIC):].decode("utf-8"))
+
+# Search keys: the first 8 bytes of every digest as big-endian uint64 (zero-padded if shorter)
+def _prefixes(digests):
+    digests = np.asarray(digests, dtype=np.uint8)
+    head = np.zeros((len(digests), 8), dtype=np.uint8)
+    width = min(8, digests.shape[1]) if digests.ndim == 2 else 0
+    head[:, :width] = digests[:, :width]
+    return head.view(">u8").ravel().astype(np.uint64)
+
+# Bloom filter bit positions of every digest: double hashing over two 64-bit words of the digest
+def _bloom_positions(digests, n_bits, n_hashes=BLOOM_HASHES):
+    digests = np.asarray(digests, dtype=np.uint8)
+    h1 = _prefixes(digests)
+    if digests.shape[1] >= 16:
+        h2 = _prefixes(digests[:, 8:16])
+    else:
+        h2 = h1 * np.uint64(0x9E3779B97F4A7C15)
+    h2 |= np.uint64(1)
+    i = np.arange(n_hashes, dtype=np.uint64)
+    return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(n_bits)
+
+# (n, digest_size) uint8 array of raw digests given as bytes or a uint8 array
+def _as_digest_array(digests, digest_size):
+    if isinstance(digests, np.ndarray):
+        return np.ascontiguousarray(digests, dtype=np.uint8).reshape(-1, digest_size)
+    return np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(-1, digest_size)
+
+# Build the index of a (rows, digest_size) uint8 digest column and write it to path.
+# bloom_bits_per_digest (e.g. 10 for about 1% false positives) adds the Bloom filter.
+def build_digest_index(digests, path, bloom_bits_per_digest=None, source=None):
+    digests = np.ascontiguousarray(digests, dtype=np.uint8)
+    n_rows, digest_size = digests.shape if digests.ndim == 2 else (0, 0)
+    records = digests.view(np.dtype((np.void, digest_size))).ravel() if digest_size else np.empty(0, "V1")
+    unique, inverse = np.unique(records, return_inverse=True) if n_rows else (records, np.empty(0, np.int64))
+    unique = np.frombuffer(unique.tobytes(), dtype=np.uint8).reshape(-1, digest_size) if digest_size else np.empty((0, 0), np.uint8)
+    order = np.argsort(inverse, kind="stable").astype(np.int64)
+    offsets = np.zeros(len(unique) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(unique)), out=offsets[1:])
+
+    sections = {"digests": unique.tobytes(), "prefixes": _prefixes(unique).astype("<u8").tobytes(),
+                "offsets": offsets.tobytes(), "rows": order.tobytes()}
+    n_bits = 0
+    if bloom_bits_per_digest and len(unique):
+        n_bits = max(64, int(bloom_bits_per_digest * len(unique)))
+        bits = np.zeros((n_bits + 7) // 8, dtype=np.uint8)
+        positions = _bloom_positions(unique, n_bits).ravel()
+        np.bitwise_or.at(bits, (positions >> np.uint64(3)).astype(np.int64), (1 << (positions & np.uint64(7))).astype(np.uint8))
+        sections["bloom"] = bits.tobytes()
+
+    header = {"format": 1, "digest_size": int(digest_size), "rows": int(n_rows), "unique": len(unique),
+              "bloom_bits": n_bits, "bloom_hashes": BLOOM_HASHES, "source": source, "sections": {}}
+    offset = HEADER_SIZE
+    for name, data in sections.items():
+        header["sections"][name] = [offset, len(data)]
+        offset += -(-len(data) // 8) * 8
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_pack_header(header))
+        for name, data in sections.items():
+            f.seek(header["sections"][name][0])
+            f.write(data)
+        f.truncate(max(offset, HEADER_SIZE))
+    os.replace(tmp_path, path)
+    return SortedDigestIndex(path)
+
+# Read-only, memory-mapped view of a .mkx file; probes work on batches of digests
+class SortedDigestIndex:
+    def __init__(self, path):
+        self.path = str(path)
+        self.header = _read_header(self.path)
+        self.digest_size = self.header["digest_size"]
+        self.rows = self.header["rows"]
+        self.n_unique = self.header["unique"]
+        self.bloom_bits = self.header["bloom_bits"]
+        self.bloom_hashes = self.header["bloom_hashes"]
+
+        # One mapping of the whole file (one file descriptor); sections are views into it
+        self._map = np.memmap(self.path, dtype=np.uint8, mode="r") if os.path.getsize(self.path) > HEADER_SIZE else None
+
+        def section(name, dtype, shape):
+            offset, length = self.header["sections"].get(name, (0, 0))
+            if not length:
+                return np.zeros(shape, dtype=dtype)
+            return self._map[offset:offset + length].view(dtype).reshape(shape)
+
+        self.unique_digests = section("digests", np.uint8, (self.n_unique, self.digest_size))
+        self.prefixes = section("prefixes", "<u8", (self.n_unique,))
+        self.offsets = section("offsets", np.int64, (self.n_unique + 1,))
+        self.row_ids = section("rows", np.int64, (self.rows,))
+        self.bloom = section("bloom", np.uint8, ((self.bloom_bits + 7) // 8,)) if self.bloom_bits else None
+
+    # Mapped indexes travel to worker processes by path and are mapped again there
+    def __reduce__(self):
+        return (SortedDigestIndex, (self.path,))
+
+    def __len__(self):
+        return self.rows
+
+    # Position of every probe digest among the distinct target digests, -1 for misses
+    def positions(self, digests):
+        if not self.n_unique:
+            return np.full(len(digests), -1, dtype=np.int64)
+        probes = _as_digest_array(digests, self.digest_size)
+        result = np.full(len(probes), -1, dtype=np.int64)
+        if not len(probes):
+            return result
+        candidates = np.arange(len(probes))
+        if self.bloom is not None:
+            positions = _bloom_positions(probes, self.bloom_bits, self.bloom_hashes)
+            bits = (self.bloom[(positions >> np.uint64(3)).astype(np.int64)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+            candidates = candidates[bits.all(axis=1)]
+            if not len(candidates):
+                return result
+        keys = _prefixes(probes[candidates])
+        lo = np.searchsorted(self.prefixes, keys, side="left")
+        hi = np.searchsorted(self.prefixes, keys, side="right")
+        single = hi - lo == 1
+        exact = np.zeros(len(candidates), dtype=bool)
+        exact[single] = (self.unique_digests[lo[single]] == probes[candidates[single]]).all(axis=1)
+        result[candidates[exact]] = lo[exact]
+        # Distinct digests sharing their first 8 bytes (only possible beyond 8 bytes) are compared one by one
+        for j in np.flatnonzero(hi - lo > 1):
+            block = self.unique_digests[lo[j]:hi[j]]
+            match = np.flatnonzero((block == probes[candidates[j]]).all(axis=1))
+            if len(match):
+                result[candidates[j]] = lo[j] + match[0]
+        return result
+
+    # Indices (into digests) of the probes that are in the index
+    def find_many(self, digests):
+        return np.flatnonzero(self.positions(digests) >= 0).tolist()
+
+    def __contains__(self, digest):
+        return bool(self.positions([digest])[0] >= 0)
+
+    # Target rows holding a digest (row order)
+    def rows_of(self, digest):
+        position = self.positions([digest])[0]
+        if position < 0:
+            return np.empty(0, dtype=np.int64)
+        return np.asarray(self.row_ids[self.offsets[position]:self.offsets[position + 1]])
+
+    # Boolean mask of the target rows whose digest was found
+    def hit_mask(self, found):
+        mask = np.zeros(self.rows, dtype=bool)
+        for position in self.positions(list(found)):
+            if position >= 0:
+                mask[self.row_ids[self.offsets[position]:self.offsets[position + 1]]] = True
+        return mask
+
+    # (hex digest, candidate values) for every target row that was hit, in row order
+    def matches(self, found):
+        digests = list(found)
+        hits = []
+        for digest, position in zip(digests, self.positions(digests)):
+            if position >= 0:
+                rows = self.row_ids[self.offsets[position]:self.offsets[position + 1]]
+                hits.extend((int(row), digest) for row in rows)
+        hits.sort()
+        return [(digest.hex(), found[digest]) for _, digest in hits]
+
+    # (digest, number of target rows) of every distinct digest occurring at least min_count times,
+    # most frequent first (ties in row order)
+    def ranked_counts(self, min_count=1):
+        counts = np.diff(self.offsets)
+        first_rows = np.asarray(self.row_ids[self.offsets[:-1]]) if self.n_unique else np.empty(0, np.int64)
+        keep = np.flatnonzero(counts >= min_count)
+        order = keep[np.lexsort((first_rows[keep], -counts[keep]))]
+        return [(self.unique_digests[i].tobytes(), int(counts[i])) for i in order]
+
+def open_digest_index(path):
+    return SortedDigestIndex(path)
+
+# Index path of one key column of a match-key store
+def digest_index_path(store_path, name):
+    return f"{store_path}.{name}{INDEX_SUFFIX}"
+
+# Mapped indexes of the given key columns of a match-key store (CSV or .mkb), one .mkx file per key
+# next to the store. Indexes are built on first use and rebuilt when the store is newer.
+def open_store_indexes(store_path, key_names, bloom_bits_per_digest=10):
+    indexes = {}
+    binary = open_matchkeys(store_path) if is_binary_path(store_path) else None
+    for name in key_names:
+        path = digest_index_path(store_path, name)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(store_path):
+            indexes[name] = SortedDigestIndex(path)
+            continue
+        if binary is not None:
+            digests = binary.digests(name)
+        else:
+            digests = hex_to_digests(pd.read_csv(store_path, usecols=[name], dtype="str")[name])
+        indexes[name] = build_digest_index(digests, path, bloom_bits_per_digest, source=str(store_path))
+    return indexes
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from json_encoding import json_default
+
+# Attribute-distribution profile of a reference dataset, shared by the attack scripts.
+# Per column: the top-K values with their counts (value_counts order) and the number of non-missing
+# values. The profile is cached next to the source in <source>.profile.json, keyed by the SHA-256
+# of the source file, and reused as long as the content is unchanged and it covers the requested
+# columns and K.
+# Unchanged size and modification time skip rehashing the source.
+
+PROFILE_SUFFIX = ".profile.json"
+PROFILE_FORMAT = 1
+
+def profile_path(source_path):
+    return str(source_path) + PROFILE_SUFFIX
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DistributionProfile:
+    def __init__(self, data):
+        self.data = data
+        self.top_k = data["top_k"]
+        self.columns = data["columns"]
+
+    # The k most frequent values of a column (as value_counts().head(k)); [] for absent columns
+    def top(self, column, k):
+        if column not in self.columns:
+            return []
+        if k > self.top_k:
+            raise ValueError(f"Profile holds the top {self.top_k} values, {k} requested")
+        return [value for value, _ in self.columns[column]["counts"][:k]]
+
+    # Relative frequency of every candidate value: {column: {value: frequency}}, over all non-missing
+    # values of the column. Candidates are looked up as they are, then by string form (top_yobs holds
+    # "1985" for 1985), and must come from the profiled top-K.
+    def frequencies(self, candidates):
+        frequencies = {}
+        for column, values in candidates.items():
+            if column not in self.columns:
+                continue
+            stats = self.columns[column]
+            total = stats["total"]
+            exact = {value: count / total for value, count in stats["counts"]}
+            as_str = {str(value): count / total for value, count in stats["counts"]}
+            frequencies[column] = {value: exact.get(value, as_str.get(str(value), 0.0)) for value in values}
+        return frequencies
+
+    def covers(self, columns, top_k):
+        return top_k <= self.top_k and all(c in self.columns or c in self.data["missing"] for c in columns)
+
+# Profile a reference DataFrame: top_k values of every present column
+def build_profile(df, columns, top_k):
+    data = {"format": PROFILE_FORMAT, "top_k": top_k, "columns": {}, "missing": []}
+    for column in columns:
+        if column not in df.columns:
+            data["missing"].append(column)
+            continue
+        counts = df[column].value_counts()
+        data["columns"][column] = {"total": int(counts.sum()),
+                                   "counts": [[value, int(n)] for value, n in zip(counts.index[:top_k].tolist(), counts.iloc[:top_k].tolist())]}
+    return DistributionProfile(data)
+
+def _write_profile(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=json_default)
+    os.replace(tmp_path, path)
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+# Profile of the CSV at source_path, from the cached artifact when it is current, else computed
+# from the file (read once, only the needed columns) and cached. A current artifact that lacks some
+# of the requested columns or K is extended rather than replaced.
+def load_profile(source_path, columns, top_k):
+    columns = list(columns)
+    path = profile_path(source_path)
+    stamp = _source_stamp(source_path)
+    content_hash = None
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("format") == PROFILE_FORMAT:
+            if cached["source"]["stamp"] != stamp:
+                content_hash = file_sha256(source_path)
+            if content_hash in (None, cached["source"]["sha256"]):
+                profile = DistributionProfile(cached)
+                if profile.covers(columns, top_k):
+                    if content_hash is not None:
+                        cached["source"]["stamp"] = stamp
+                        _write_profile(path, cached)
+                    return profile
+                # Same source, other scripts' request: profile the union so they share one artifact
+                top_k = max(top_k, profile.top_k)
+                columns += [c for c in list(profile.columns) + cached["missing"] if c not in columns]
+
+    header = pd.read_csv(source_path, nrows=0).columns
+    needed = {c for c in columns if c in header}
+    df = pd.read_csv(source_path, usecols=lambda c: c in needed)
+    profile = build_profile(df, columns, top_k)
+    profile.data["source"] = {"path": os.path.basename(str(source_path)), "sha256": content_hash or file_sha256(source_path),
+                              "stamp": stamp}
+    _write_profile(path, profile.data)
+    return profile
@@ -0,0 +1,100 @@
+import hashlib
+import hmac
+import os
+
+# Digest backends for match keys.
+# A backend is named by a spec string: "sha256", "blake2b", "blake2s" or "hmac-sha256",
+# optionally with ":N" to keep only the first N bytes of the digest (e.g. "sha256:16").
+# The HMAC key is passed explicitly or read from the MATCHKEY_HMAC_KEY environment variable.
+
+DEFAULT_BACKEND = "sha256"
+HMAC_KEY_ENV = "MATCHKEY_HMAC_KEY"
+
+_HASHLIB_BACKENDS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s": hashlib.blake2s,
+}
+
+class HashBackend:
+    def __init__(self, spec, key=None):
+        name, _, truncate = spec.partition(":")
+        self.spec = spec
+        self.name = name
+        self.truncate = int(truncate) if truncate else None
+        self._key = key
+
+        if name in _HASHLIB_BACKENDS:
+            constructor = _HASHLIB_BACKENDS[name]
+            self.new = constructor
+            self._oneshot = lambda data: constructor(data).digest()
+            self.cache_id = spec
+        elif name == "hmac-sha256":
+            if key is None:
+                key = os.environ.get(HMAC_KEY_ENV)
+            if not key:
+                raise ValueError(f"hmac-sha256 needs a key (argument or {HMAC_KEY_ENV})")
+            key = key.encode("utf-8") if isinstance(key, str) else key
+            keyed = hmac.new(key, digestmod=hashlib.sha256)
+
+            def new(data=b""):
+                h = keyed.copy()
+                h.update(data)
+                return h
+
+            self.new = new
+            self._oneshot = lambda data: hmac.digest(key, data, "sha256")
+            # Different keys give different digests, so they must not share memo entries
+            self.cache_id = f"{spec}/{hashlib.sha256(key).hexdigest()[:16]}"
+        else:
+            raise ValueError(f"Unknown hash backend: {spec}")
+
+        full_size = self.new().digest_size
+        if self.truncate is not None and not 0 < self.truncate <= full_size:
+            raise ValueError(f"Cannot truncate {name} ({full_size} bytes) to {self.truncate} bytes")
+        self.digest_size = self.truncate or full_size
+
+    # Backends travel to worker processes by spec (the HMAC key is re-read or passed along)
+    def __reduce__(self):
+        return (HashBackend, (self.spec, self._key))
+
+    def __repr__(self):
+        return f"HashBackend({self.spec!r})"
+
+    # Final digest bytes of a hash object produced by new() (applies truncation)
+    def finish(self, h):
+        return h.digest()[:self.truncate] if self.truncate else h.digest()
+
+    def digest(self, data):
+        d = self._oneshot(data)
+        return d[:self.truncate] if self.truncate else d
+
+    def hexdigest(self, data):
+        return self.digest(data).hex()
+
+    # Digest bytes of many pre-image strings
+    def digest_many(self, preimages):
+        oneshot = self._oneshot
+        n = self.truncate
+        if n:
+            return [oneshot(p.encode("utf-8"))[:n] for p in preimages]
+        return [oneshot(p.encode("utf-8")) for p in preimages]
+
+    # Hex digests of many pre-image strings (the match-key CSV representation)
+    def hexdigest_many(self, preimages):
+        if self.name in _HASHLIB_BACKENDS and not self.truncate:
+            new = self.new
+            return [new(p.encode("utf-8")).hexdigest() for p in preimages]
+        return [d.hex() for d in self.digest_many(preimages)]
+
+_default_backend = HashBackend(DEFAULT_BACKEND)
+
+# Resolve a backend from a spec string (None means the default SHA-256); backends pass through
+def get_backend(backend=None, key=None):
+    if isinstance(backend, HashBackend):
+        return backend
+    if backend is None and key is None:
+        return _default_backend
+    return HashBackend(backend or DEFAULT_BACKEND, key)
+
+AVAILABLE_BACKENDS = ["sha256", "blake2b", "blake2s", "hmac-sha256"]
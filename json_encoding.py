@@ -0,0 +1,8 @@
+import numpy as np
+
+# json default= hook for the repo's JSON outputs (hit tables, profiles, lookup-table manifests):
+# numpy scalars, e.g. from value_counts or groupby keys, are written as plain JSON numbers/strings
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot write {type(value).__name__} as JSON")
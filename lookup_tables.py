@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from attack_engine import RUN_SIZE, TargetIndex, combination_values, distinct_candidates, write_sorted_runs
+from digest_index import SortedDigestIndex, build_digest_index
+from hash_backends import get_backend
+from json_encoding import json_default
+
+# Persistent precomputed lookup tables.
+# One table holds the digest of every candidate combination of one key. It is keyed by the key
+# scheme, the key, the hash backend and the candidate lists, and is stored in
+# <root>/<scheme>-<key>-<fingerprint>/. Repeat attacks with the same reference distribution against
+# other target files reuse it, so they only probe and never hash. Digests are partitioned by their
+# first partition_bits bits into part-NNNN.mkx files (sorted, memory-mapped, with a Bloom filter,
+# see digest_index.py). Each file comes with part-NNNN.ranks.npy, the product-order rank of each
+# digest's combination, which table.json decodes back to candidate values. A digest keeps its last
+# combination in product order, like the streaming attack. table.json is written last and marks the
+# table as complete; the hashing itself runs through the resumable sorted runs of probe_external.
+
+TABLE_MANIFEST = "table.json"
+MAX_OPEN_PARTS = 64  # partitions kept mapped between lookups
+
+def _fingerprint(plan, name, lists, backend):
+    key = plan.key(name)
+    spec = {"scheme": plan.scheme, "key": name, "backend": backend.cache_id,
+            "components": [list(c) for c in key.components],
+            "candidates": [[[repr(value), normalized] for value, normalized in candidates] for candidates in lists]}
+    return hashlib.sha256(json.dumps(spec, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+# Directory of the table of one key for the given prepared candidates
+def lookup_table_path(root, plan, name, prepared, backend=None):
+    lists = distinct_candidates(plan.candidate_lists(name, prepared))
+    fingerprint = _fingerprint(plan, name, lists, get_backend(backend))
+    return os.path.join(root, f"{plan.scheme}-{name}-{fingerprint[:16]}")
+
+# Partition of every digest: its first partition_bits bits (at most 16)
+def _partitions(digests, partition_bits):
+    head = np.zeros((len(digests), 2), dtype=np.uint8)
+    width = min(2, digests.shape[1])
+    head[:, :width] = digests[:, :width]
+    return head.view(">u2").ravel() >> (16 - partition_bits)
+
+def _part_path(path, part):
+    return os.path.join(path, f"part-{part:04d}")
+
+class LookupTable:
+    def __init__(self, path):
+        self.path = str(path)
+        with open(os.path.join(self.path, TABLE_MANIFEST), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.partition_bits = self.manifest["partition_bits"]
+        self.digest_size = self.manifest["digest_size"]
+        self.lists = [[tuple(candidate) for candidate in candidates] for candidates in self.manifest["candidates"]]
+        self._parts = {}
+
+    def __len__(self):
+        return self.manifest["digests"]
+
+    def _part(self, part):
+        if part not in self._parts:
+            if len(self._parts) >= MAX_OPEN_PARTS:
+                del self._parts[next(iter(self._parts))]
+            base = _part_path(self.path, part)
+            self._parts[part] = ((SortedDigestIndex(base + ".mkx"), np.load(base + ".ranks.npy", mmap_mode="r"))
+                                 if os.path.exists(base + ".mkx") else None)
+        return self._parts[part]
+
+    # {digest: candidate values} for the given digests (bytes or a uint8 array) found in the table
+    def lookup(self, digests):
+        if not isinstance(digests, np.ndarray):
+            digests = [digest for digest in digests if len(digest) == self.digest_size]
+            digests = np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(len(digests), -1)
+        if not len(digests) or digests.shape[1] != self.digest_size:
+            return {}
+        parts = _partitions(digests, self.partition_bits)
+        found = {}
+        for part in np.unique(parts).tolist():
+            table = self._part(part)
+            if table is None:
+                continue
+            index, ranks = table
+            probes = digests[parts == part]
+            positions = index.positions(probes)
+            for i in np.flatnonzero(positions >= 0).tolist():
+                found[probes[i].tobytes()] = combination_values(self.lists, int(ranks[positions[i]]))
+        return found
+
+# Build (or reuse) the table of one key under root. The runs are hashed under <table>.build, which
+# an interrupted build resumes from; partitions are merged from the runs one at a time.
+def build_lookup_table(plan, name, prepared, root, backend=None, partition_bits=8, run_size=RUN_SIZE, workers=1):
+    if not 0 < partition_bits <= 16:
+        raise ValueError("partition_bits must be between 1 and 16")
+    backend = get_backend(backend)
+    path = lookup_table_path(root, plan, name, prepared, backend)
+    if os.path.exists(os.path.join(path, TABLE_MANIFEST)):
+        return LookupTable(path)
+    lists = distinct_candidates(plan.candidate_lists(name, prepared))
+    os.makedirs(path, exist_ok=True)
+    n_digests = 0
+    if lists and all(lists):
+        runs = [np.load(run, mmap_mode="r") for run in
+                write_sorted_runs(lists, path + ".build", backend, run_size, workers)]
+        # Runs are sorted by digest, so each partition is one contiguous slice of every run
+        bounds = []
+        for records in runs:
+            parts = _partitions(np.ascontiguousarray(records["digest"]).view(np.uint8).reshape(len(records), -1), partition_bits)
+            bounds.append(np.searchsorted(parts, np.arange((1 << partition_bits) + 1)))
+        for part in range(1 << partition_bits):
+            records = np.concatenate([records[b[part]:b[part + 1]] for records, b in zip(runs, bounds)])
+            if not len(records):
+                continue
+            # Runs come in rank order, so after a stable sort the last of equal digests is the winner
+            records = records[np.argsort(records["digest"], kind="stable")]
+            last = np.ones(len(records), dtype=bool)
+            last[:-1] = records["digest"][1:] != records["digest"][:-1]
+            records = records[last]
+            digests = np.ascontiguousarray(records["digest"]).view(np.uint8).reshape(len(records), -1)
+            base = _part_path(path, part)
+            np.save(base + ".ranks.tmp.npy", np.ascontiguousarray(records["rank"]))
+            os.replace(base + ".ranks.tmp.npy", base + ".ranks.npy")
+            build_digest_index(digests, base + ".mkx", bloom_bits_per_digest=10)
+            n_digests += len(records)
+        del runs
+        shutil.rmtree(path + ".build")
+    manifest = {"format": 1, "scheme": plan.scheme, "key": name, "backend": backend.spec,
+                "digest_size": backend.digest_size, "partition_bits": partition_bits, "digests": n_digests,
+                "candidates": [[list(candidate) for candidate in candidates] for candidates in lists]}
+    tmp_path = os.path.join(path, TABLE_MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, default=json_default)
+    os.replace(tmp_path, os.path.join(path, TABLE_MANIFEST))
+    return LookupTable(path)
+
+# Attack one key column of a store through its lookup table (built on first use).
+# Returns (matches, hits) like attack_key.
+def attack_key_lookup(plan, name, prepared, store, root, backend=None, partition_bits=8, run_size=RUN_SIZE,
+                      workers=1, index=None):
+    table = build_lookup_table(plan, name, prepared, root, backend, partition_bits, run_size, workers)
+    index = index if index is not None else TargetIndex.from_store(store, name)
+    if isinstance(index, SortedDigestIndex):
+        found = table.lookup(np.asarray(index.unique_digests))
+    else:
+        found = table.lookup(index.digest_set)
+    return index.matches(found), index.hit_mask(found).sum()
@@ -1,59 +1,17 @@
-import hashlib
+import os
 import pandas as pd
 import random
 from faker import Faker
-import re
+
+from matchkey_incremental import update_matchkeys_incremental
+from matchkey_store import write_matchkeys
+from matchkeys import ONS_PLAN, generate_matchkeys_chunked, generate_ons_13_matchkeys
 
 # Initialize Faker for German locale
 """ fake = Faker("de_DE")
 Faker.seed(42)
 random.seed(42) """
 
-# Normalize strings
-def normalize(s):
-    return re.sub(r'\W+', '', s.lower().strip()) if s else ""
-
-# Phonetic encoding (simplified Soundex-like for demonstration)
-def soundex_simple(name):
-    name = normalize(name)
-    if not name:
-        return ""
-    code = name[0].upper()
-    mappings = {"bfpv": "1", "cgjkqsxz": "2", "dt": "3", "l": "4", "mn": "5", "r": "6"}
-    for char in name[1:]:
-        for key, value in mappings.items():
-            if char in key:
-                if value != code[-1]:
-                    code += value
-    return (code + "000")[:4]
-
-# Generate hash
-def hash_fields(fields):
-    combined = "".join(normalize(f) for f in fields if f)
-    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
-
-# ONS-style match key generation for a DataFrame
-def generate_ons_13_matchkeys(df):
-    df["dob"] = df["year_of_birth"].apply(lambda y: f"{y}-01-01" if pd.notnull(y) else "")
-    
-    df["mk1"] = df.apply(lambda x: hash_fields([x["first_name"], x["last_name"], x["dob"]]), axis=1)
-    df["mk2"] = df.apply(lambda x: hash_fields([x["first_name"][0] if pd.notnull(x["first_name"]) else "", x["last_name"], x["dob"]]), axis=1)
-    df["mk3"] = df.apply(lambda x: hash_fields([x["first_name"], x["zip"], x["dob"]]), axis=1)
-    df["mk4"] = df.apply(lambda x: hash_fields([soundex_simple(x["last_name"]), x["dob"]]), axis=1)
-    df["mk5"] = df.apply(lambda x: hash_fields([x["first_name"][:3] if pd.notnull(x["first_name"]) else "", x["last_name"], x["year_of_birth"]]), axis=1)
-    df["mk6"] = df.apply(lambda x: hash_fields([x["first_name"], soundex_simple(x["last_name"]), x["dob"]]), axis=1)
-    df["mk7"] = df.apply(lambda x: hash_fields([x["first_name"][0] if pd.notnull(x["first_name"]) else "", soundex_simple(x["last_name"]), x["dob"]]), axis=1)
-    df["mk8"] = df.apply(lambda x: hash_fields([x["first_name"], x["last_name"], x["dob"][:7] if pd.notnull(x["dob"]) and len(x["dob"]) >= 7 else ""]), axis=1)
-    df["mk9"] = df.apply(lambda x: hash_fields([
-        x["first_name"][0] if pd.notnull(x["first_name"]) else "",
-        x["last_name"][0] if pd.notnull(x["last_name"]) else "",
-        x["year_of_birth"]]), axis=1)
-    df["mk10"] = df.apply(lambda x: hash_fields([x["last_name"], x["zip"], x["year_of_birth"]]), axis=1)
-    df["mk11"] = df.apply(lambda x: hash_fields([x["first_name"], x["year_of_birth"], x["zip"][:3] if pd.notnull(x["zip"]) else ""]), axis=1)
-    df["mk12"] = df.apply(lambda x: hash_fields([soundex_simple(x["first_name"]), x["last_name"], x["dob"]]), axis=1)
-    df["mk13"] = df.apply(lambda x: hash_fields([x["last_name"], x["year_of_birth"], x["zip"][:3] if pd.notnull(x["zip"]) else ""]), axis=1)
-    return df[[f"mk{i}" for i in range(1, 14)]]
-
 # Create a test record
 """ record = {
     "first_name": "Anna",
@@ -68,21 +26,42 @@ def generate_ons_13_matchkeys(df):
 """ match_keys = ons_match_keys(record)
 print(json.dumps(match_keys, indent=4)) """ 
 
-# Fix the normalize function to handle float inputs (e.g., NaN) robustly
-def normalize(s):
-    try:
-        return re.sub(r'\W+', '', str(s).lower().strip()) if pd.notnull(s) else ""
-    except Exception:
-        return ""
-    
-# Reload and reprocess the dataset
-df_input = pd.read_csv("ohio_voter_clean.csv", dtype="str")
-df_with_keys = generate_ons_13_matchkeys(df_input)
+# Input and output files (give the output a .mkb extension for the compact binary format)
+input_csv_path = "ohio_voter_clean.csv"
+keys_only_csv_path = "ohio_voter_matchkeys_ons.csv"
 
-# Keep only the match key columns in the output
-match_key_columns = ["mk1", "mk2", "mk3", "mk4", "mk5", "mk6", "mk7", "mk8", "mk9", "mk10", "mk11", "mk12", "mk13"]
-df_keys_only = df_with_keys[match_key_columns]
+# Set chunk_size (rows per chunk) to stream the input through a process pool instead of loading it at once
+chunk_size = None
+workers = os.cpu_count()
 
-# Save to a new CSV
-keys_only_csv_path = "ohio_voter_matchkeys_ons.csv"
-df_keys_only.to_csv(keys_only_csv_path, index=False)
\ No newline at end of file
+# Digest backend (see hash_backends.py): "sha256", "blake2b", "blake2s", "hmac-sha256" (key in
+# MATCHKEY_HMAC_KEY), optionally truncated as e.g. "sha256:16"
+hash_backend = "sha256"
+
+# Set incremental = True to refresh an existing output: only new or changed records are rehashed,
+# the rest keep their previous keys (fingerprints are stored next to the output). id_column names
+# the voter ID column, if the extract has one.
+incremental = False
+id_column = None
+
+if __name__ == "__main__":
+    if chunk_size:
+        n_rows = generate_matchkeys_chunked(input_csv_path, keys_only_csv_path, generate_ons_13_matchkeys,
+                                            chunksize=chunk_size, workers=workers, scheme="ons", hash_backend=hash_backend, dtype="str")
+        print(f"Wrote match keys for {n_rows} rows to {keys_only_csv_path}")
+    elif incremental:
+        df_input = pd.read_csv(input_csv_path, dtype="str")
+        stats = update_matchkeys_incremental(df_input, keys_only_csv_path, generate_ons_13_matchkeys, ONS_PLAN.fields,
+                                             id_column=id_column, scheme="ons", hash_backend=hash_backend)
+        print(f"Refreshed {keys_only_csv_path}: {stats['recomputed']} of {stats['rows']} rows recomputed")
+    else:
+        # Reload and reprocess the dataset
+        df_input = pd.read_csv(input_csv_path, dtype="str")
+        df_with_keys = generate_ons_13_matchkeys(df_input, hash_backend)
+
+        # Keep only the match key columns in the output
+        match_key_columns = ["mk1", "mk2", "mk3", "mk4", "mk5", "mk6", "mk7", "mk8", "mk9", "mk10", "mk11", "mk12", "mk13"]
+        df_keys_only = df_with_keys[match_key_columns]
+
+        # Save to a new CSV (or .mkb)
+        write_matchkeys(keys_only_csv_path, df_keys_only, scheme="ons", extra={"hash": hash_backend})
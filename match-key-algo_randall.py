@@ -1,25 +1,19 @@
-import hashlib
+import os
 import random
 from faker import Faker
 import pandas as pd
-import re
 import json
 
+from matchkey_incremental import update_matchkeys_incremental
+from matchkey_store import write_matchkeys
+from matchkeys import RANDALL_PLAN, generate_matchkeys_chunked, generate_randall_match_keys
+
 
 # Initialize Faker for German locale
 """ fake = Faker("de_DE")
 Faker.seed(42)
 random.seed(42) """
 
-# Helper to normalize strings
-def normalize(s):
-    return re.sub(r'\W+', '', s.lower().strip()) if s else ""
-
-# Generate SHA-256 hash of concatenated, normalized fields
-def hash_fields(fields):
-    combined = "".join(normalize(f) for f in fields if f)
-    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
-
 # Improved Randall-style match key algorithm (2021 version with better QID mixing)
 """ def randall_improved_match_keys(record):
     qid_sets = [
@@ -42,26 +36,6 @@ def hash_fields(fields):
     
     return match_keys """
 
-# Function to generate Randall-style match keys
-def generate_randall_match_keys(df):
-    qid_sets = [
-        ["first_name", "last_name", "dob"],
-        ["first_name", "zip", "year_of_birth"],
-        ["last_name", "dob", "gender"],
-        ["first_name", "gender", "zip"],
-        ["first_name", "last_name", "email"],
-        ["last_name", "year_of_birth", "zip"],
-        ["first_initial", "last_name", "dob"],
-        ["first_name", "address", "zip"],
-        ["first_name", "dob", "email"],
-        ["last_name", "gender", "email"]
-    ]
-
-    for i, qids in enumerate(qid_sets):
-        col_name = f"mk_randall_{i+1}"
-        df[col_name] = df.apply(lambda row: hash_fields([row.get(qid, "") for qid in qids]), axis=1)
-    return df
-
 # Sample test record
 """ record = {
     "first_name": "Anna",
@@ -79,23 +53,46 @@ def generate_randall_match_keys(df):
 """ randall_keys = randall_improved_match_keys(record)
 print(json.dumps(randall_keys, indent=4)) """ 
 
-# Fix the normalize function to handle float inputs (e.g., NaN) robustly
-def normalize(s):
-    try:
-        return re.sub(r'\W+', '', str(s).lower().strip()) if pd.notnull(s) else ""
-    except Exception:
-        return ""
-    
-# Load the noisy dataset
-df_input = pd.read_csv("ohio_voter_clean.csv")
+# Input and output files (give the output a .mkb extension for the compact binary format)
+input_csv_path = "ohio_voter_clean.csv"
+randall_keys_csv_path = "ohio_voter_matchkeys_randall.csv"
 
-# Generate Randall-style match keys
-df_with_randall_keys = generate_randall_match_keys(df_input)
+# Set chunk_size (rows per chunk) to stream the input through a process pool instead of loading it at once.
+# Column dtypes are inferred over the whole file first, so the keys equal those of a full load.
+chunk_size = None
+workers = os.cpu_count()
 
-# Keep only match key columns
-randall_key_columns = [f"mk_randall_{i+1}" for i in range(10)]
-df_randall_keys_only = df_with_randall_keys[randall_key_columns]
+# Digest backend (see hash_backends.py): "sha256", "blake2b", "blake2s", "hmac-sha256" (key in
+# MATCHKEY_HMAC_KEY), optionally truncated as e.g. "sha256:16"
+hash_backend = "sha256"
 
-# Save to CSV
-randall_keys_csv_path = "ohio_voter_matchkeys_randall.csv"
-df_randall_keys_only.to_csv(randall_keys_csv_path, index=False)
\ No newline at end of file
+# Set incremental = True to refresh an existing output: only new or changed records are rehashed,
+# the rest keep their previous keys (fingerprints are stored next to the output). id_column names
+# the voter ID column, if the extract has one.
+incremental = False
+id_column = None
+
+if __name__ == "__main__":
+    if chunk_size:
+        n_rows = generate_matchkeys_chunked(input_csv_path, randall_keys_csv_path, generate_randall_match_keys,
+                                            chunksize=chunk_size, workers=workers, scheme="randall", hash_backend=hash_backend,
+                                            fields=RANDALL_PLAN.fields)
+        print(f"Wrote match keys for {n_rows} rows to {randall_keys_csv_path}")
+    elif incremental:
+        df_input = pd.read_csv(input_csv_path)
+        stats = update_matchkeys_incremental(df_input, randall_keys_csv_path, generate_randall_match_keys, RANDALL_PLAN.fields,
+                                             id_column=id_column, scheme="randall", hash_backend=hash_backend)
+        print(f"Refreshed {randall_keys_csv_path}: {stats['recomputed']} of {stats['rows']} rows recomputed")
+    else:
+        # Load the noisy dataset
+        df_input = pd.read_csv(input_csv_path)
+
+        # Generate Randall-style match keys
+        df_with_randall_keys = generate_randall_match_keys(df_input, hash_backend)
+
+        # Keep only match key columns
+        randall_key_columns = [f"mk_randall_{i+1}" for i in range(10)]
+        df_randall_keys_only = df_with_randall_keys[randall_key_columns]
+
+        # Save to CSV (or .mkb)
+        write_matchkeys(randall_keys_csv_path, df_randall_keys_only, scheme="randall", extra={"hash": hash_backend})
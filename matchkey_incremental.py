@@ -0,0 +1,151 @@
+import csv
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from hash_backends import get_backend
+from matchkey_store import BinaryMatchKeyWriter, hex_to_digests, is_binary_path, load_matchkeys, open_matchkeys, patch_matchkeys, write_matchkeys
+
+# Incremental match-key regeneration for refreshed extracts.
+# Every record gets a fingerprint of its source QID columns (plus the voter ID, if there is one);
+# only records whose fingerprint is new are sent through the generator, all others keep the keys
+# stored by the previous run. Fingerprints live next to the key store in <store>.fingerprints.csv,
+# in the same row order.
+
+FINGERPRINT_SUFFIX = ".fingerprints.csv"
+
+def fingerprint_path(store_path):
+    return str(store_path) + FINGERPRINT_SUFFIX
+
+# 128-bit fingerprint per row over the given columns.
+# repr keeps 1985 and "1985" apart; salt folds in the scheme and hash backend so that changing
+# either invalidates every stored fingerprint.
+def row_fingerprints(df, fields, salt=""):
+    parts = [
+        df[field].astype(object).map(repr) if field in df.columns else pd.Series("<absent>", index=df.index)
+        for field in fields
+    ]
+    joined = parts[0].str.cat(parts[1:], sep="\x1f") if len(parts) > 1 else parts[0]
+    prefix = salt + "\x1e"
+    blake2b = hashlib.blake2b
+    return [blake2b((prefix + row).encode("utf-8"), digest_size=16).hexdigest() for row in joined]
+
+# Write to a temporary file and move it into place, so an interrupted refresh keeps the old store
+def _replace_atomically(path, write):
+    tmp_path = f"{path}.tmp{'.mkb' if is_binary_path(path) else ''}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+# Number of rows and key columns of an existing key store, without loading it
+def _store_layout(store_path):
+    if is_binary_path(store_path):
+        store = open_matchkeys(store_path)
+        return store.rows, store.key_names
+    with open(store_path, "rb") as f:
+        lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+    return lines - 1, pd.read_csv(store_path, nrows=0).columns.tolist()
+
+def _write_fingerprints(path, fingerprints, ids=None, append=False):
+    with open(path, "a" if append else "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        if not append:
+            writer.writerow(["fingerprint"] if ids is None else ["id", "fingerprint"])
+        writer.writerows(zip(fingerprints) if ids is None else zip(ids, fingerprints))
+
+# Regenerate the key store at store_path for df, recomputing only new or changed records.
+# fields are the source columns the keys depend on; id_column (optional) ties records across
+# extracts. Returns a dict with the number of rows, reused rows and recomputed rows.
+#
+# When every reused record keeps its row position (edits in place, rows added or dropped at the
+# end), the store is patched rather than rewritten: only the recomputed rows are written, through a
+# memmap over the fixed-width .mkb records or CSV lines (matchkey_store.patch_matchkeys), and nothing
+# is written at all if no record changed. Otherwise (records moved or dropped in the middle) the
+# store is rebuilt, copying reused .mkb records as raw bytes. Either way every row is fingerprinted,
+# so a refresh costs one pass over the extract plus work proportional to the changed rows.
+def update_matchkeys_incremental(df, store_path, generator, fields, id_column=None, scheme=None, hash_backend=None):
+    backend = get_backend(hash_backend)
+    fp_fields = ([id_column] if id_column else []) + [f for f in fields if f != id_column]
+    fingerprints = np.array(row_fingerprints(df, fp_fields, salt=f"{scheme}|{backend.cache_id}|{','.join(fp_fields)}"), dtype=object)
+    ids = df[id_column].astype(str).to_numpy(dtype=object) if id_column else None
+    probe = ids + "\x1f" + fingerprints if id_column else fingerprints
+
+    # Row of the previous store each record can reuse (-1 if none); a record at its old position
+    # reuses that row, so duplicate records stay in place too
+    reuse = np.full(len(df), -1, dtype=np.int64)
+    fp_file = fingerprint_path(store_path)
+    previous_rows, previous_names = 0, None
+    if os.path.exists(store_path) and os.path.exists(fp_file):
+        previous_rows, previous_names = _store_layout(store_path)
+        previous_fp = pd.read_csv(fp_file, dtype="str", keep_default_na=False)
+        if len(previous_fp) == previous_rows and bool(id_column) == ("id" in previous_fp.columns):
+            if id_column:
+                previous_probe = (previous_fp["id"] + "\x1f" + previous_fp["fingerprint"]).to_numpy(dtype=object)
+            else:
+                previous_probe = previous_fp["fingerprint"].to_numpy(dtype=object)
+            lookup = pd.Series(np.arange(previous_rows), index=previous_probe)
+            lookup = lookup[~lookup.index.duplicated()]
+            reuse = lookup.reindex(probe).fillna(-1).to_numpy(dtype=np.int64, copy=True)
+            common = min(len(df), previous_rows)
+            in_place = np.flatnonzero(previous_probe[:common] == probe[:common])
+            reuse[in_place] = in_place
+        else:
+            previous_rows, previous_names = 0, None
+
+    changed = np.flatnonzero(reuse < 0)
+    kept = np.flatnonzero(reuse >= 0)
+    stats = {"rows": len(df), "reused": len(kept), "recomputed": len(changed)}
+    fresh = generator(df.iloc[changed], hash_backend=backend)
+    patch = len(kept) > 0 and list(fresh.columns) == previous_names and bool(np.all(reuse[kept] == kept))
+    appended = len(df) >= previous_rows and not np.any(changed < previous_rows)
+
+    if patch and appended and not len(changed):
+        return stats
+    appended = patch and appended
+    # Drop the old fingerprints first: a store without them is simply rebuilt in full next time.
+    # Rows appended to the store before their fingerprints make the row counts differ, which does the same.
+    if not appended and os.path.exists(fp_file):
+        os.remove(fp_file)
+    if patch:
+        try:
+            patch_matchkeys(store_path, len(df), changed, fresh)
+        except ValueError:
+            patch = appended = False
+    if not patch:
+        _rebuild_store(store_path, fresh, changed, kept, reuse, scheme, backend)
+    if appended:
+        _write_fingerprints(fp_file, fingerprints[changed], ids[changed] if id_column else None, append=True)
+    else:
+        _replace_atomically(fp_file, lambda path: _write_fingerprints(path, fingerprints, ids))
+    return stats
+
+# Write a new store: reused rows come from the previous store (raw records for .mkb), recomputed
+# rows from fresh
+def _rebuild_store(store_path, fresh, changed, kept, reuse, scheme, backend):
+    n_rows = len(changed) + len(kept)
+    if is_binary_path(store_path):
+        records = np.empty((n_rows, len(fresh.columns), backend.digest_size), dtype=np.uint8)
+        if len(kept):
+            previous = open_matchkeys(store_path)
+            records[kept] = previous.records[reuse[kept]][:, [previous.key_names.index(n) for n in fresh.columns]]
+            del previous
+        if len(changed):
+            records[changed] = np.stack([hex_to_digests(fresh[name]) for name in fresh.columns], axis=1)
+
+        def write(path):
+            with BinaryMatchKeyWriter(path, scheme=scheme, extra={"hash": backend.spec}) as writer:
+                writer.append(fresh.iloc[:0])
+                writer.append_records(records)
+        _replace_atomically(store_path, write)
+        return
+    previous_keys = load_matchkeys(store_path) if len(kept) else None
+    columns = {}
+    for name in fresh.columns:
+        column = np.empty(n_rows, dtype=object)
+        if len(kept):
+            column[kept] = previous_keys[name].to_numpy(dtype=object)[reuse[kept]]
+        column[changed] = fresh[name].to_numpy(dtype=object)
+        columns[name] = column
+    keys = pd.DataFrame(columns)
+    _replace_atomically(store_path, lambda path: write_matchkeys(path, keys, scheme=scheme, extra={"hash": backend.spec}))
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+# Declarative specification of the ONS and Randall match keys.
+# Generators and attacks compile these with matchkeys.compile_plan instead of hard-coding each key.
+
+# One part of a match key's pre-image.
+# transform is applied to the raw value before normalization:
+#   None          the value as is
+#   "initial"     first character (first_name[0])
+#   "prefix3"     first three characters (first_name[:3], zip[:3])
+#   "year_month"  dob[:7] if dob has at least 7 characters, else ""
+#   "soundex"     soundex_simple(value)
+# source is the reference column the attacks draw candidates from (defaults to field).
+Component = namedtuple("Component", ["field", "transform", "source"], defaults=[None, None])
+
+# A match key: column name, human-readable label and its components in hashing order
+KeySpec = namedtuple("KeySpec", ["name", "label", "components"])
+
+# Fields a scheme derives from another column before hashing instead of reading them from the
+# dataset: {scheme: {field: (source column, format)}}. ONS extracts only carry a year of birth,
+# so the ONS dob is always YYYY-01-01.
+DERIVED_FIELDS = {"ons": {"dob": ("year_of_birth", "{}-01-01")}}
+
+ONS_KEYS = [
+    KeySpec("mk1", "first + last + dob", [
+        Component("first_name"), Component("last_name"), Component("dob")]),
+    KeySpec("mk2", "first_initial + last + dob", [
+        Component("first_name", "initial", "first_initial"), Component("last_name"), Component("dob")]),
+    KeySpec("mk3", "first + zip + dob", [
+        Component("first_name"), Component("zip"), Component("dob")]),
+    KeySpec("mk4", "soundex(last name) + dob", [
+        Component("last_name", "soundex"), Component("dob")]),
+    KeySpec("mk5", "first[:3] + last + year_of_birth", [
+        Component("first_name", "prefix3"), Component("last_name"), Component("year_of_birth")]),
+    KeySpec("mk6", "first + soundex(last name) + dob", [
+        Component("first_name"), Component("last_name", "soundex"), Component("dob")]),
+    KeySpec("mk7", "first_initial + soundex(last name) + dob", [
+        Component("first_name", "initial", "first_initial"), Component("last_name", "soundex"), Component("dob")]),
+    KeySpec("mk8", "first + last + dob[:7]", [
+        Component("first_name"), Component("last_name"), Component("dob", "year_month")]),
+    KeySpec("mk9", "first_initial + last_initial + year_of_birth", [
+        Component("first_name", "initial", "first_initial"), Component("last_name", "initial"),
+        Component("year_of_birth")]),
+    KeySpec("mk10", "last_name + zip + year_of_birth", [
+        Component("last_name"), Component("zip"), Component("year_of_birth")]),
+    KeySpec("mk11", "first + year_of_birth + zip[:3]", [
+        Component("first_name"), Component("year_of_birth"), Component("zip", "prefix3")]),
+    KeySpec("mk12", "soundex(first_name) + last_name + dob", [
+        Component("first_name", "soundex"), Component("last_name"), Component("dob")]),
+    KeySpec("mk13", "last_name + year_of_birth + zip[:3]", [
+        Component("last_name"), Component("year_of_birth"), Component("zip", "prefix3")]),
+]
+
+# QID sets of the improved Randall-style match keys (mk_randall_1 .. mk_randall_10)
+RANDALL_QID_SETS = [
+    ["first_name", "last_name", "dob"],
+    ["first_name", "zip", "year_of_birth"],
+    ["last_name", "dob", "gender"],
+    ["first_name", "gender", "zip"],
+    ["first_name", "last_name", "email"],
+    ["last_name", "year_of_birth", "zip"],
+    ["first_initial", "last_name", "dob"],
+    ["first_name", "address", "zip"],
+    ["first_name", "dob", "email"],
+    ["last_name", "gender", "email"]
+]
+
+RANDALL_LABELS = [
+    "first + last + dob",
+    "first + zip + yob",
+    "last_name + dob + gender",
+    "first_name + gender + zip",
+    "first + last + email",
+    "last + yob + zip",
+    "first_initial + last + dob",
+    "first_name + address + zip",
+    "first_name + dob + email",
+    "last_name + gender + email",
+]
+
+RANDALL_KEYS = [
+    KeySpec(f"mk_randall_{i+1}", label, [Component(qid) for qid in qids])
+    for i, (qids, label) in enumerate(zip(RANDALL_QID_SETS, RANDALL_LABELS))
+]
@@ -0,0 +1,233 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Match-key storage: the CSV of hex digests and a compact binary format (.mkb).
+#
+# .mkb layout: a fixed 4096-byte header, then one fixed-width record per row holding the raw
+# digests of every key (rows x keys x digest_size bytes). The header is b"MKB1" followed by
+# space-padded JSON: {"format": 1, "scheme": ..., "keys": [...], "digest_size": 32, "rows": n}.
+# The body can be np.memmap-ed directly; at 32 bytes per SHA-256 it is about half the CSV size.
+
+MAGIC = b"MKB1"
+HEADER_SIZE = 4096
+BINARY_SUFFIX = ".mkb"
+
+def is_binary_path(path):
+    return str(path).endswith(BINARY_SUFFIX)
+
+def _pack_header(header):
+    payload = MAGIC + json.dumps(header).encode("utf-8")
+    if len(payload) > HEADER_SIZE:
+        raise ValueError(f"Match-key header exceeds {HEADER_SIZE} bytes")
+    return payload.ljust(HEADER_SIZE, b" ")
+
+def _read_header(f):
+    raw = f.read(HEADER_SIZE)
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not a binary match-key file")
+    return json.loads(raw[len(MAGIC):].decode("utf-8"))
+
+# Hex digest column -> (rows, digest_size) uint8 array
+def hex_to_digests(hex_values):
+    hex_values = list(hex_values)
+    if not hex_values:
+        return np.empty((0, 0), dtype=np.uint8)
+    digest_size = len(hex_values[0]) // 2
+    return np.frombuffer(bytes.fromhex("".join(hex_values)), dtype=np.uint8).reshape(-1, digest_size)
+
+# (rows, digest_size) uint8 array -> list of hex digests
+def digests_to_hex(digests):
+    digests = np.ascontiguousarray(digests)
+    width = 2 * digests.shape[1] if digests.ndim == 2 else 0
+    joined = digests.tobytes().hex()
+    return [joined[i:i + width] for i in range(0, len(joined), width)] if width else []
+
+# DataFrame of hex match keys -> (rows, keys, digest_size) uint8 records in the given key order
+def _frame_records(keys_df, key_names):
+    return np.stack([hex_to_digests(keys_df[name]) for name in key_names], axis=1)
+
+# Appends DataFrames of hex match keys to a .mkb file; the row count is written on close
+class BinaryMatchKeyWriter:
+    def __init__(self, path, scheme=None, extra=None):
+        self.path = path
+        self.header = {"format": 1, "scheme": scheme, "keys": None, "digest_size": None, "rows": 0}
+        self.header.update(extra or {})
+        self._file = open(path, "wb")
+
+    def append(self, keys_df):
+        if self.header["keys"] is None:
+            self.header["keys"] = list(keys_df.columns)
+            self._file.write(_pack_header(self.header))
+        elif list(keys_df.columns) != self.header["keys"]:
+            raise ValueError("Match-key columns differ from the ones already written")
+        if not len(keys_df):
+            return
+        self.append_records(_frame_records(keys_df, self.header["keys"]))
+
+    # Append raw (rows, keys, digest_size) records, e.g. gathered from another .mkb file
+    def append_records(self, records):
+        if not len(records):
+            return
+        digest_size = records.shape[2]
+        if self.header["digest_size"] is None:
+            self.header["digest_size"] = digest_size
+        elif digest_size != self.header["digest_size"]:
+            raise ValueError("Digest size differs from the one already written")
+        self._file.write(np.ascontiguousarray(records).tobytes())
+        self.header["rows"] += len(records)
+
+    def close(self):
+        if self.header["keys"] is None:
+            self.header["keys"] = []
+            self._file.write(_pack_header(self.header))
+        self._file.seek(0)
+        self._file.write(_pack_header(self.header))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Appends DataFrames of hex match keys to a CSV (the original output format)
+class CsvMatchKeyWriter:
+    def __init__(self, path, scheme=None, extra=None):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._header = True
+
+    def append(self, keys_df):
+        keys_df.to_csv(self._file, index=False, header=self._header)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Writer for path: binary for .mkb, CSV otherwise
+def open_matchkey_writer(path, scheme=None, extra=None):
+    writer = BinaryMatchKeyWriter if is_binary_path(path) else CsvMatchKeyWriter
+    return writer(path, scheme, extra)
+
+# Write a whole DataFrame of hex match keys (CSV or .mkb by extension)
+def write_matchkeys(path, keys_df, scheme=None, extra=None):
+    with open_matchkey_writer(path, scheme, extra) as writer:
+        writer.append(keys_df)
+
+# Patch a key store in place: resize it to n_rows rows (truncating, or extending with new rows at
+# the end), then overwrite the rows at positions with keys_df (hex, one row per position). Only the
+# touched rows are written, through a memmap: .mkb records are fixed-width, and so are the lines of
+# a CSV of hex digests. Raises ValueError, before changing anything, if keys_df does not fit the
+# file's layout (other key columns or digest size, or a CSV whose lines are not all the same width).
+def patch_matchkeys(path, n_rows, positions, keys_df):
+    patch = _patch_binary if is_binary_path(path) else _patch_csv
+    patch(path, n_rows, np.asarray(positions, dtype=np.int64), keys_df)
+
+def _patch_binary(path, n_rows, positions, keys_df):
+    with open(path, "r+b") as f:
+        header = _read_header(f)
+        records = None
+        if len(positions):
+            if list(keys_df.columns) != header["keys"]:
+                raise ValueError("Match-key columns differ from the ones in the file")
+            records = _frame_records(keys_df, header["keys"])
+            if header["digest_size"] not in (None, records.shape[2]):
+                raise ValueError("Digest size differs from the one in the file")
+            header["digest_size"] = records.shape[2]
+        f.truncate(HEADER_SIZE + n_rows * len(header["keys"]) * (header["digest_size"] or 0))
+        header["rows"] = n_rows
+        f.seek(0)
+        f.write(_pack_header(header))
+    if records is not None:
+        _write_rows(path, HEADER_SIZE, n_rows, positions, records.reshape(len(records), -1))
+
+def _patch_csv(path, n_rows, positions, keys_df):
+    with open(path, "rb") as f:
+        header = f.readline()
+        first = f.readline()
+        size = os.fstat(f.fileno()).st_size
+    names = header.decode("utf-8").rstrip("\r\n").split(",")
+    lines = None
+    if len(positions):
+        if list(keys_df.columns) != names:
+            raise ValueError("Match-key columns differ from the ones in the file")
+        text = keys_df.to_csv(header=False, index=False, lineterminator="\n").encode("utf-8")
+        width = len(first) or text.index(b"\n") + 1
+        lines = np.frombuffer(text, dtype=np.uint8)
+        if lines.size != len(positions) * width or np.any(lines.reshape(-1, width)[:, -1] != ord("\n")):
+            raise ValueError("Match-key lines differ in width")
+        lines = lines.reshape(-1, width)
+    width = len(first) or (lines.shape[1] if lines is not None else 0)
+    if width and (size - len(header)) % width:
+        raise ValueError("Match-key lines differ in width")
+    with open(path, "r+b") as f:
+        f.truncate(len(header) + n_rows * width)
+    if lines is not None:
+        _write_rows(path, len(header), n_rows, positions, lines)
+
+# Overwrite rows of fixed-width bytes at positions of a file body starting at offset
+def _write_rows(path, offset, n_rows, positions, rows):
+    body = np.memmap(path, dtype=np.uint8, mode="r+", offset=offset, shape=(n_rows, rows.shape[1]))
+    body[positions] = rows
+    body.flush()
+    del body
+
+# Read-only, memory-mapped view of a .mkb file
+class BinaryMatchKeys:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.header = _read_header(f)
+        self.scheme = self.header["scheme"]
+        self.key_names = self.header["keys"]
+        self.rows = self.header["rows"]
+        self.digest_size = self.header["digest_size"] or 0
+        shape = (self.rows, len(self.key_names), self.digest_size)
+        if self.rows and self.digest_size:
+            self.records = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER_SIZE, shape=shape)
+        else:
+            self.records = np.empty(shape, dtype=np.uint8)
+
+    # (rows, digest_size) view of one key's digests
+    def digests(self, name):
+        return self.records[:, self.key_names.index(name), :]
+
+    def hex(self, name):
+        return digests_to_hex(self.digests(name))
+
+    def to_frame(self):
+        return pd.DataFrame({name: self.hex(name) for name in self.key_names})
+
+def open_matchkeys(path):
+    return BinaryMatchKeys(path)
+
+# CSV of hex match keys read one key column at a time: store[name] gives the column like the
+# DataFrame would, so runs whose targets live in mapped indexes never hold the whole hex frame
+class CsvMatchKeys:
+    def __init__(self, path):
+        self.path = path
+        self.key_names = pd.read_csv(path, nrows=0).columns.tolist()
+
+    def __getitem__(self, name):
+        return pd.read_csv(self.path, usecols=[name], dtype="str")[name]
+
+# Match-key store for the attacks: an open .mkb file (memory-mapped, digests stay raw bytes), else
+# the CSV as a DataFrame of hex digests, or as CsvMatchKeys with lazy=True
+def open_store(path, lazy=False):
+    if is_binary_path(path):
+        return open_matchkeys(path)
+    return CsvMatchKeys(path) if lazy else load_matchkeys(path)
+
+# Load match keys as a DataFrame of hex digests, from either a CSV or a .mkb file
+def load_matchkeys(path):
+    if is_binary_path(path):
+        return open_matchkeys(path).to_frame()
+    return pd.read_csv(path, dtype="str")
@@ -0,0 +1,353 @@
+import functools
+import os
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from hash_backends import get_backend
+from matchkey_spec import DERIVED_FIELDS, ONS_KEYS, RANDALL_KEYS
+from matchkey_store import open_matchkey_writer
+
+# Shared match-key primitives, the compiled key plans and the columnar ONS/Randall engine.
+# The per-row helpers are kept so attacks and benchmarks can reproduce single keys.
+
+# Normalize strings (handles NaN and non-string inputs)
+def normalize(s):
+    try:
+        return re.sub(r'\W+', '', str(s).lower().strip()) if pd.notnull(s) else ""
+    except Exception:
+        return ""
+
+# Phonetic encoding (simplified Soundex-like for demonstration), table-driven.
+# One pass over the name with a precomputed letter -> digit dict: unmapped characters are skipped, a
+# digit is only appended if it differs from the last character of the code so far (vowels do not
+# separate repeats), then pad/cut to 4.
+SOUNDEX_GROUPS = {"bfpv": "1", "cgjkqsxz": "2", "dt": "3", "l": "4", "mn": "5", "r": "6"}
+_SOUNDEX_DIGITS = {char: digit for chars, digit in SOUNDEX_GROUPS.items() for char in chars}
+
+# Soundex of an already-normalized name
+def soundex_normalized(name):
+    if not name:
+        return ""
+    code = name[0].upper()
+    last = code[-1]
+    digits = _SOUNDEX_DIGITS
+    for char in name[1:]:
+        digit = digits.get(char)
+        if digit is not None and digit != last:
+            code += digit
+            if len(code) >= 4:
+                break
+            last = digit
+    return (code + "000")[:4]
+
+def soundex_simple(name):
+    return soundex_normalized(normalize(name))
+
+# Generate hash (SHA-256 unless another backend from hash_backends is given)
+def hash_fields(fields, backend=None):
+    combined = "".join(normalize(f) for f in fields if f)
+    return get_backend(backend).hexdigest(combined.encode("utf-8"))
+
+_MISSING = object()
+
+# Bounded least-recently-used memo, so repeated values across calls (e.g. chunks) are not recomputed
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    # Look up every key; the missing ones are computed together by compute_many(list) -> list
+    def map(self, keys, compute_many):
+        data = self._data
+        get = data.get
+        results = [get(key, _MISSING) for key in keys]
+        missing = [i for i, value in enumerate(results) if value is _MISSING]
+        self.hits += len(results) - len(missing)
+        self.misses += len(missing)
+
+        if len(missing) < len(results):
+            move_to_end = data.move_to_end
+            for key, value in zip(keys, results):
+                if value is not _MISSING:
+                    move_to_end(key)
+        if missing:
+            computed = compute_many([keys[i] for i in missing])
+            for i, value in zip(missing, computed):
+                results[i] = value
+            # Only the most recent maxsize entries can survive, so skip inserting the rest
+            keep = missing[-self.maxsize:] if self.maxsize else []
+            data.update((keys[i], results[i]) for i in keep)
+            while len(data) > self.maxsize:
+                data.popitem(last=False)
+        return results
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+# Memo tables shared by all generators: raw value -> normalized string, name -> Soundex, pre-image -> digest
+normalize_cache = LRUCache(1_000_000)
+soundex_cache = LRUCache(500_000)
+digest_cache = LRUCache(500_000)
+_digest_cache_backend = None  # cache_id of the backend digest_cache currently holds
+
+# Resize the memo tables (number of entries, not bytes)
+def set_cache_size(normalized=None, soundex=None, digests=None):
+    for cache, size in ((normalize_cache, normalized), (soundex_cache, soundex), (digest_cache, digests)):
+        if size is not None:
+            cache.maxsize = size
+            while len(cache._data) > size:
+                cache._data.popitem(last=False)
+
+# Component transforms of matchkey_spec, applied to raw (non-missing) values before normalization
+def _year_month(value):
+    value = str(value)
+    return value[:7] if len(value) >= 7 else ""
+
+TRANSFORMS = {
+    "initial": lambda value: str(value)[:1],
+    "prefix3": lambda value: str(value)[:3],
+    "year_month": _year_month,
+    "soundex": soundex_simple,
+}
+
+# hash_fields skips falsy fields (e.g. 0) and normalize turns missing values into ""
+def _normalize_many(keys):
+    return [normalize(value) if value else "" for _, value in keys]
+
+def _soundex_many(keys):
+    return [soundex_simple(value) for _, value in keys]
+
+# Apply a transform to distinct raw values (Soundex goes through its memo table)
+def apply_transform(transform, values):
+    if transform is None:
+        return list(values)
+    if transform == "soundex":
+        return soundex_cache.map([(v.__class__, v) for v in values], _soundex_many)
+    func = TRANSFORMS[transform]
+    return [func(v) for v in values]
+
+# Normalized form of each value, as hash_fields would see it (memoized)
+def normalize_values(values):
+    # Cache keys carry the type so that e.g. 1985 and 1985.0 do not share an entry
+    return normalize_cache.map([(v.__class__, v) for v in values], _normalize_many)
+
+# pd.factorize, but 1, 1.0 and True stay distinct values (they hash equal and would be merged).
+# pandas' string hash table also stops at NUL characters ("\x00b" == "\x00"), so such columns
+# take the same (type, value) route.
+def factorize_exact(values):
+    s = pd.Series(values, copy=False).astype(object)
+    inferred = pd.api.types.infer_dtype(s, skipna=True)
+    exact = not inferred.startswith("mixed") and not (inferred == "string" and s.str.contains("\x00", regex=False).any())
+    if exact:
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        return codes, list(uniques)
+    codes, uniques = pd.factorize(s.map(lambda v: (v.__class__, v), na_action="ignore"), use_na_sentinel=True)
+    return codes, [u[1] for u in uniques]
+
+# Factorize a column, then transform and normalize only its distinct values.
+# Returns (codes, uniques): uniques are distinct normalized strings, codes map every row to one of them.
+def factorize_normalized(values, transform=None):
+    codes, raw_uniques = factorize_exact(values)
+    normalized = normalize_values(apply_transform(transform, raw_uniques))
+    normalized.append("")  # missing values
+    codes = np.where(codes < 0, len(raw_uniques), codes)
+
+    # Different raw values can normalize to the same string ("Smith", "SMITH ")
+    norm_codes, uniques = pd.factorize(np.array(normalized, dtype=object))
+    return norm_codes[codes], list(uniques)
+
+# Soundex codes for a whole array of names (missing names give "").
+# Only distinct names are encoded, through the Soundex memo table.
+def soundex_batch(names):
+    codes, uniques = factorize_exact(names)
+    encoded = np.array(apply_transform("soundex", uniques) + [""], dtype=object)
+    return encoded[np.where(codes < 0, len(uniques), codes)]
+
+# Factorized column holding the same value on every row (e.g. a QID the dataset does not have)
+def constant_factor(n_rows, value=""):
+    return np.zeros(n_rows, dtype=np.int64), [value]
+
+# First row index of every code
+def _first_rows(codes, n_codes):
+    first = np.empty(n_codes, dtype=np.int64)
+    rows = np.arange(len(codes), dtype=np.int64)
+    first[codes[::-1]] = rows[::-1]
+    return first
+
+# Hash one match key given its factorized components (in key order).
+# The component tuples are factorized too, so each distinct pre-image is hashed once and broadcast back.
+def hash_factorized(components, backend=None):
+    global _digest_cache_backend
+    backend = get_backend(backend)
+    if _digest_cache_backend != backend.cache_id:
+        digest_cache.clear()
+        _digest_cache_backend = backend.cache_id
+
+    tuple_codes = np.zeros(len(components[0][0]), dtype=np.int64)
+    for codes, uniques in components:
+        tuple_codes, _ = pd.factorize(tuple_codes * len(uniques) + codes)
+    n_tuples = int(tuple_codes.max()) + 1 if len(tuple_codes) else 0
+
+    first = _first_rows(tuple_codes, n_tuples)
+    preimages = np.full(n_tuples, "", dtype=object)
+    for codes, uniques in components:
+        preimages = preimages + np.array(uniques, dtype=object)[codes[first]]
+
+    digests = np.array(digest_cache.map(preimages.tolist(), backend.hexdigest_many), dtype=object)
+    return digests[tuple_codes]
+
+# Compiled form of a key specification (see matchkey_spec).
+# Every distinct (field, transform) node is evaluated once and shared by all keys that use it,
+# e.g. soundex(last_name) for mk4, mk6 and mk7 or first_name[0] for mk2, mk7 and mk9.
+class MatchKeyPlan:
+    def __init__(self, keys, scheme=None):
+        self.keys = list(keys)
+        self.scheme = scheme
+        self.nodes = []
+        self.key_nodes = {}
+        for key in self.keys:
+            indices = []
+            for component in key.components:
+                node = (component.field, component.transform)
+                if node not in self.nodes:
+                    self.nodes.append(node)
+                indices.append(self.nodes.index(node))
+            self.key_nodes[key.name] = indices
+
+    # Source fields the keys read, in first-use order
+    @property
+    def fields(self):
+        return list(dict.fromkeys(field for field, _ in self.nodes))
+
+    @property
+    def key_names(self):
+        return [key.name for key in self.keys]
+
+    def key(self, name):
+        return next(key for key in self.keys if key.name == name)
+
+    # Generate every key of the plan for a DataFrame; fields it does not have hash as ""
+    def evaluate(self, df, backend=None):
+        backend = get_backend(backend)
+        factors = [
+            factorize_normalized(df[field], transform) if field in df.columns else constant_factor(len(df))
+            for field, transform in self.nodes
+        ]
+        return pd.DataFrame({
+            name: hash_factorized([factors[i] for i in indices], backend)
+            for name, indices in self.key_nodes.items()
+        }, index=df.index)
+
+    # Normalize attack candidates once per (source, transform) node used by any key.
+    # candidates maps reference columns to value lists; the result feeds candidate_lists.
+    def prepare_candidates(self, candidates):
+        prepared = {}
+        for key in self.keys:
+            for component in key.components:
+                node = (component.source or component.field, component.transform)
+                if node not in prepared:
+                    values = list(candidates.get(node[0], []))
+                    normalized = normalize_values(apply_transform(component.transform, values))
+                    prepared[node] = list(zip(values, normalized))
+        return prepared
+
+    # Candidate lists of a key: one list of (value, normalized) per component, in hashing order
+    def candidate_lists(self, name, prepared):
+        return [prepared[(c.source or c.field, c.transform)] for c in self.key(name).components]
+
+# Compile a list of KeySpec into a MatchKeyPlan; scheme names it in binary match-key files
+def compile_plan(keys, scheme=None):
+    return MatchKeyPlan(keys, scheme)
+
+ONS_PLAN = compile_plan(ONS_KEYS, "ons")
+RANDALL_PLAN = compile_plan(RANDALL_KEYS, "randall")
+
+# ONS-style match key generation for a DataFrame (columnar).
+# The ONS dob is derived from year_of_birth as YYYY-01-01 (DERIVED_FIELDS); everything else comes from ONS_PLAN.
+def generate_ons_13_matchkeys(df, hash_backend=None):
+    source, template = DERIVED_FIELDS["ons"]["dob"]
+    yob = df[source].astype(object)
+    dob = pd.Series("", index=df.index, dtype=object)
+    has_yob = yob.notna()
+    dob[has_yob] = yob[has_yob].map(template.format)
+    return ONS_PLAN.evaluate(df.assign(dob=dob), hash_backend)
+
+# Randall-style match key generation for a DataFrame (columnar, same memoization as ONS).
+# QIDs the dataset does not have hash as empty strings, like row.get(qid, "") did.
+def generate_randall_match_keys(df, hash_backend=None):
+    return RANDALL_PLAN.evaluate(df, hash_backend)
+
+# Common dtype of one column over the chunks of a CSV, as pandas infers it for the whole file:
+# numeric chunks widen (int64 and float64 give float64, e.g. a year column with a gap in one chunk),
+# anything mixed with text is text
+def _common_dtype(dtypes):
+    dtypes = list(dict.fromkeys(dtypes))
+    if len(dtypes) == 1:
+        return dtypes[0]
+    if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in dtypes):
+        return np.result_type(*dtypes)
+    text = [d for d in dtypes if not pd.api.types.is_numeric_dtype(d)]
+    return text[0] if len(set(text)) == 1 else object
+
+# Whole-file dtypes of the given CSV columns (all columns if None), from a first pass over only
+# those columns in chunks
+def infer_csv_dtypes(input_path, columns=None, chunksize=200_000, **read_csv_kwargs):
+    read_csv_kwargs = {k: v for k, v in read_csv_kwargs.items() if k not in ("usecols", "dtype")}
+    header = pd.read_csv(input_path, nrows=0, **read_csv_kwargs).columns
+    columns = [c for c in (header if columns is None else columns) if c in header]
+    seen = {column: [] for column in columns}
+    for chunk in pd.read_csv(input_path, usecols=columns, chunksize=chunksize, **read_csv_kwargs):
+        for column in columns:
+            seen[column].append(chunk[column].dtype)
+    return {column: _common_dtype(dtypes) for column, dtypes in seen.items() if dtypes}
+
+# Stream a CSV through a match-key generator in fixed-size chunks.
+# Chunks are fanned out to a process pool and appended to output_path in input order
+# (CSV, or the binary format for a .mkb path); at most 2 * workers chunks are in flight,
+# so peak memory does not grow with the input.
+# pandas infers dtypes per chunk, so a year column with a gap could read as 1985 in one chunk and
+# 1985.0 in another. Unless dtype is given, the dtypes of fields (the columns the generator
+# reads, all columns if None) are inferred over the whole file first and used for every chunk,
+# so the keys equal those of the generator run on pd.read_csv(input_path).
+def generate_matchkeys_chunked(input_path, output_path, generator, chunksize=200_000, workers=None,
+                               scheme=None, hash_backend=None, fields=None, **read_csv_kwargs):
+    workers = workers or os.cpu_count() or 1
+    backend = get_backend(hash_backend)
+    generator = functools.partial(generator, hash_backend=backend)
+    if "dtype" not in read_csv_kwargs:
+        read_csv_kwargs["dtype"] = infer_csv_dtypes(input_path, fields, chunksize, **read_csv_kwargs)
+    reader = pd.read_csv(input_path, chunksize=chunksize, **read_csv_kwargs)
+    n_rows = 0
+
+    with open_matchkey_writer(output_path, scheme, {"hash": backend.spec}) as writer:
+        if workers == 1:
+            for chunk in reader:
+                keys = generator(chunk)
+                writer.append(keys)
+                n_rows += len(keys)
+            return n_rows
+
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in reader:
+                pending.append(pool.submit(generator, chunk))
+                if len(pending) >= 2 * workers:
+                    keys = pending.popleft().result()
+                    writer.append(keys)
+                    n_rows += len(keys)
+            while pending:
+                keys = pending.popleft().result()
+                writer.append(keys)
+                n_rows += len(keys)
+    return n_rows